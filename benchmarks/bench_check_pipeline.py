@@ -0,0 +1,71 @@
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pipeline
+
+# Simulated probe latency: most domains answer quickly, a few hang until the probe timeout
+def make_latencies(count, slow_ratio, timeout, seed=1):
+    rng = random.Random(seed)
+    latencies = []
+    for _ in range(count):
+        if rng.random() < slow_ratio:
+            latencies.append(timeout)
+        else:
+            latencies.append(rng.lognormvariate(-2.0, 0.8))  # Median ~135 ms
+    return latencies
+
+# In-memory stand-ins for get_domain_chunk / get_domain_page
+class FakeTable:
+    def __init__(self, latencies, query_cost):
+        self.rows = list(enumerate(latencies, start=1))
+        self.done = set()
+        self.query_cost = query_cost
+
+    def get_chunk(self, batch_size=500):
+        time.sleep(self.query_cost)
+        return [row for row in self.rows if row[0] not in self.done][:batch_size]
+
+    def get_page(self, last_id, page_size):
+        time.sleep(self.query_cost)
+        last_id = last_id or 0
+        return [(row[0], row) for row in self.rows if row[0] > last_id][:page_size]
+
+async def run(mode, latencies, workers, query_cost):
+    table = FakeTable(latencies, query_cost)
+
+    async def handle(row):
+        domain_id, latency = row
+        await asyncio.sleep(latency)
+        table.done.add(domain_id)
+
+    start = time.perf_counter()
+    if mode == 'batch':
+        handled = await pipeline.run_batches(table.get_chunk, handle, concurrency=workers)
+    else:
+        handled = await pipeline.run_stream(table.get_page, handle, workers=workers)
+    return handled, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare batch and streaming work pipelines with simulated probes")
+    parser.add_argument('--domains', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=100)
+    parser.add_argument('--slow-ratio', type=float, default=0.05, help="Share of domains that hit the probe timeout")
+    parser.add_argument('--timeout', type=float, default=2.0, help="Simulated probe timeout in seconds")
+    parser.add_argument('--query-cost', type=float, default=0.02, help="Simulated seconds per work-selection query")
+    args = parser.parse_args()
+
+    latencies = make_latencies(args.domains, args.slow_ratio, args.timeout)
+    ideal = sum(latencies) / args.workers
+    print(f"{args.domains:,} domains, {args.workers} workers, ideal makespan {ideal:.1f}s")
+    for mode in ('batch', 'stream'):
+        handled, elapsed = asyncio.run(run(mode, latencies, args.workers, args.query_cost))
+        print(f"{mode:6} {handled:,} domains in {elapsed:.1f}s -> {handled / elapsed:,.0f} domains/sec")
+
+if __name__ == "__main__":
+    main()
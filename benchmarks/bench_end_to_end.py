@@ -0,0 +1,203 @@
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dns_stage
+import prober
+import roomba
+import roomba_cms_and_status
+from metrics import metrics
+from seen_filter import BloomFilter
+from storage import SQLiteStorage
+from web_farm import build_farm, serve_farm_process
+
+# Offline end-to-end benchmark: the discovery crawler and the status/CMS checker against a local web farm,
+# on a scratch SQLite database. Results go to a JSON file that --compare can diff against a previous run.
+
+RESULTS_FILE = 'bench_results.json'
+
+# Metrics compared by --compare, and whether a higher value is better
+COMPARED = {'domains_per_sec': True, 'p50_ms': False, 'p99_ms': False, 'cpu_seconds': False, 'peak_rss_mb': False}
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+def current_rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1048576
+    except (OSError, ValueError):
+        return 0.0
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1048576 if sys.platform == 'darwin' else peak / 1024
+
+def cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime, children.ru_utime + children.ru_stime
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+# Wrap an async per-domain function so every call's latency is recorded
+def timed(function, latencies):
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await function(*args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - start)
+    return wrapper
+
+# Time one stage and summarize it; run() returns the number of domains handled
+def measure(name, run, latencies):
+    cpu_start, children_start = cpu_seconds()
+    start = time.perf_counter()
+    domains = run()
+    elapsed = time.perf_counter() - start
+    cpu_end, children_end = cpu_seconds()
+    result = {
+        'domains': domains,
+        'elapsed_seconds': round(elapsed, 3),
+        'domains_per_sec': round(domains / elapsed, 2) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 1),
+        'cpu_seconds': round(cpu_end - cpu_start, 2),
+        'cpu_percent': round((cpu_end - cpu_start) / elapsed * 100, 1) if elapsed else 0.0,
+        'worker_cpu_seconds': round(children_end - children_start, 2),  # Wappalyzer pool processes that have exited
+        'rss_mb': round(current_rss_mb(), 1),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+    }
+    print(f"{name:6} {domains:,} domains in {elapsed:.1f}s -> {result['domains_per_sec']:,.1f} domains/sec, "
+          f"p50 {result['p50_ms']:.0f} ms, p99 {result['p99_ms']:.0f} ms, CPU {result['cpu_percent']:.0f}%, "
+          f"RSS {result['rss_mb']:.0f} MB (peak {result['peak_rss_mb']:.0f} MB)")
+    return result
+
+def run_crawl(storage, farm_size, latencies):
+    roomba.storage = storage
+    roomba.METRICS_DUMP_PATH = None
+    roomba.initialize_db()
+    roomba.seen_filter = BloomFilter(capacity=max(farm_size * 4, 10000))
+    roomba.crawl_domain_async = timed(roomba.crawl_domain_async, latencies)
+    stats = {'total': 0, 'crawled': 0, 'uncrawled': 0}
+    asyncio.run(roomba.run_async_engine(None, stats, threading.Lock(), [], []))
+    roomba.stats_counters.flush()
+    return storage.read_stats()['crawled']
+
+def run_check(storage, latencies):
+    roomba_cms_and_status.storage = storage
+    roomba_cms_and_status.METRICS_PORT = 0
+    roomba_cms_and_status.METRICS_DUMP_PATH = None
+    roomba_cms_and_status.check_domain_status = timed(roomba_cms_and_status.check_domain_status, latencies)
+    return asyncio.run(roomba_cms_and_status.check_domains())
+
+def compare(current, previous_path):
+    with open(previous_path) as f:
+        previous = json.load(f)
+    print(f"Compared with {previous_path} ({previous.get('commit') or 'unknown commit'}, {previous.get('timestamp')}):")
+    for stage, result in current['stages'].items():
+        before = previous.get('stages', {}).get(stage)
+        if not before:
+            continue
+        for metric, higher_is_better in COMPARED.items():
+            old, new = before.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old * 100
+            better = change > 0 if higher_is_better else change < 0
+            print(f"  {stage:6} {metric:16} {old:>10,.1f} -> {new:>10,.1f}  {change:+6.1f}% {'better' if better else 'worse' if change else ''}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the crawler and the status/CMS checker against a local web farm")
+    parser.add_argument('--hosts', type=int, default=1000, help="Virtual hosts in the farm")
+    parser.add_argument('--links-per-page', type=int, default=60)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--pages-dir', help="Directory of recorded <host>.html pages added to the farm")
+    parser.add_argument('--stages', default='crawl,check', help="Comma-separated: crawl, check")
+    parser.add_argument('--concurrency', type=int, default=roomba.ASYNC_CONCURRENCY, help="Crawler in-flight fetches")
+    parser.add_argument('--probe-mode', choices=['first', 'staggered', 'all', 'sequential'], default=prober.PROBE_MODE)
+    parser.add_argument('--no-politeness', action='store_true', help="Disable the per-host/per-IP fetch scheduler")
+    parser.add_argument('--response-cache', choices=['record', 'replay'],
+                        help="Record fetched pages, or replay them from a previous --response-cache record run")
+    parser.add_argument('--response-cache-dir', default='bench_response_cache')
+    parser.add_argument('--output', default=RESULTS_FILE, help="JSON result file")
+    parser.add_argument('--compare', metavar='JSON', help="Previous result file to compare against")
+    parser.add_argument('--keep-db', metavar='PATH', help="Use this SQLite file instead of a temporary one and keep it")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.CRITICAL)  # Fetch errors are expected; keep the report readable
+    stages = [stage.strip() for stage in args.stages.split(',') if stage.strip()]
+
+    farm = build_farm(args.hosts, args.links_per_page, args.seed, args.pages_dir)
+    ready = multiprocessing.Queue()
+    farm_process = multiprocessing.Process(target=serve_farm_process, args=(farm, ready), daemon=True)
+    farm_process.start()
+    http_port, dns_port = ready.get(timeout=30)
+    proxy = f"http://127.0.0.1:{http_port}"
+    os.environ.update({'HTTP_PROXY': proxy, 'HTTPS_PROXY': proxy, 'NO_PROXY': 'localhost'})
+    dns_stage.DNS_NAMESERVER = ('127.0.0.1', dns_port)
+    roomba.ASYNC_CONCURRENCY = args.concurrency
+    prober.PROBE_MODE = args.probe_mode
+    roomba.POLITENESS = roomba_cms_and_status.POLITENESS = not args.no_politeness
+    roomba.RESPONSE_CACHE_MODE = roomba_cms_and_status.RESPONSE_CACHE_MODE = args.response_cache
+    roomba.RESPONSE_CACHE_PATH = roomba_cms_and_status.RESPONSE_CACHE_PATH = args.response_cache_dir
+    print(f"Web farm: {len(farm):,} hosts behind {proxy}, DNS on 127.0.0.1:{dns_port}")
+
+    scratch = None if args.keep_db else tempfile.TemporaryDirectory()
+    storage = SQLiteStorage(args.keep_db or os.path.join(scratch.name, 'bench.db'))
+    results = {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': {'hosts': len(farm), 'links_per_page': args.links_per_page, 'seed': args.seed,
+                   'concurrency': args.concurrency, 'probe_mode': args.probe_mode, 'storage': 'sqlite',
+                   'politeness': not args.no_politeness, 'response_cache': args.response_cache},
+        'stages': {},
+    }
+    try:
+        if 'crawl' in stages:
+            latencies = []
+            results['stages']['crawl'] = measure('crawl', lambda: run_crawl(storage, len(farm), latencies), latencies)
+        if 'check' in stages:
+            if 'crawl' not in stages:
+                storage.initialize()
+                storage.connection.executemany("INSERT OR IGNORE INTO domains (domain) VALUES (?)", [(name,) for name in farm])
+            latencies = []
+            results['stages']['check'] = measure('check', lambda: run_check(storage, latencies), latencies)
+        results['errors'] = metrics.snapshot().get('counters', {}).get('errors_total', {})
+    finally:
+        storage.close()
+        farm_process.terminate()
+        if scratch is not None:
+            scratch.cleanup()
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+import argparse
+import glob
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from link_extractor import ENGINES, iter_links
+
+CHUNK_SIZE = 16384  # Matches roomba.PAGE_CHUNK_SIZE
+
+# Load saved pages from a corpus directory (*.html / *.htm)
+def load_corpus(path):
+    pages = []
+    for filename in sorted(glob.glob(os.path.join(path, '**', '*.htm*'), recursive=True)):
+        with open(filename, 'rb') as f:
+            pages.append(f.read())
+    return pages
+
+# Build link-dense synthetic homepages when no corpus is given
+def synthetic_corpus(count, links_per_page=400):
+    random.seed(1)
+    pages = []
+    for i in range(count):
+        parts = ['<html><head><title>Page</title><script>var x = "<b>";</script></head><body>']
+        for j in range(links_per_page):
+            host = f"site{random.randint(0, 50000)}.{random.choice(['com', 'net', 'org'])}"
+            parts.append(f'<div class="item"><p>Some text {j}</p><a class="l" href="https://{host}/path/{j}?a=1&amp;b=2">{host}</a></div>')
+            if j % 5 == 0:
+                parts.append(f'<a href="/local/{j}">local</a>')
+        parts.append('</body></html>')
+        pages.append(''.join(parts).encode('utf-8'))
+    return pages
+
+def chunked(page):
+    return [page[i:i + CHUNK_SIZE] for i in range(0, len(page), CHUNK_SIZE)]
+
+# Run one engine over every page and return pages/sec, links and peak traced memory
+def run_engine(engine, pages, repeat):
+    chunked_pages = [chunked(page) for page in pages]
+    links = 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for chunks in chunked_pages:
+            links += sum(1 for _ in iter_links(chunks, 'http://example.com/', engine))
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    for chunks in chunked_pages:
+        for _ in iter_links(chunks, 'http://example.com/', engine):
+            pass
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return len(pages) * repeat / elapsed, links // repeat, peak
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark link extraction engines")
+    parser.add_argument('--corpus', help="Directory of saved HTML pages (defaults to synthetic pages)")
+    parser.add_argument('--pages', type=int, default=200, help="Number of synthetic pages")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--engines', default=','.join(ENGINES))
+    args = parser.parse_args()
+
+    pages = load_corpus(args.corpus) if args.corpus else synthetic_corpus(args.pages)
+    total_bytes = sum(len(page) for page in pages)
+    print(f"{len(pages)} pages, {total_bytes / 1048576:.1f} MB")
+
+    for engine in args.engines.split(','):
+        try:
+            pages_per_sec, links, peak = run_engine(engine, pages, args.repeat)
+        except ImportError as e:
+            print(f"{engine:11} skipped ({e})")
+            continue
+        print(f"{engine:11} {pages_per_sec:8.1f} pages/sec  {links:,} links  peak {peak / 1048576:.2f} MB")
+
+if __name__ == "__main__":
+    main()
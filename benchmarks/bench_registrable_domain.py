@@ -0,0 +1,60 @@
+import argparse
+import csv
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import public_suffix
+from public_suffix import domain_from_url, load_trie
+
+TARGET_LIST = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'output_target_list.csv')
+
+# Old extract_domains behaviour: the raw host part of the URL, minus "www."
+def split_host(link):
+    domain = link.split('/')[2].lower()
+    return domain[4:] if domain.startswith('www.') else domain
+
+# Build a link sample from output_target_list.csv plus synthetic subdomain-heavy links
+def sample_links(count):
+    random.seed(1)
+    links = []
+    with open(TARGET_LIST, newline='') as f:
+        links.extend(row[0] for row in csv.reader(f) if row and row[0].startswith('http'))
+    suffixes = ['com', 'co.uk', 'com.au', 'github.io', 'kawasaki.jp', 'org', 'net', 'de', 'blogspot.com']
+    while len(links) < count:
+        base = f"site{random.randint(0, count // 20)}.{random.choice(suffixes)}"
+        sub = random.choice(['', 'www.', 'blog.', 'cdn1.', 'shop.', 'user@', 'a.b.'])
+        port = random.choice(['', '', ':8080'])
+        links.append(f"https://{sub}{base}{port}/path?q=1")
+    return links[:count]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark registrable-domain extraction")
+    parser.add_argument('--links', type=int, default=200000)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    public_suffix._trie = None
+    load_trie()
+    print(f"trie load: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    links = sample_links(args.links)
+
+    start = time.perf_counter()
+    old = {split_host(link) for link in links}
+    old_elapsed = time.perf_counter() - start
+
+    public_suffix.registrable_domain.cache_clear()
+    start = time.perf_counter()
+    new = {domain_from_url(link) for link in links} - {None}
+    new_elapsed = time.perf_counter() - start
+
+    print(f"split('/')[2]:      {len(links) / old_elapsed:12,.0f} links/sec  {len(old):,} distinct frontier rows")
+    print(f"registrable_domain: {len(links) / new_elapsed:12,.0f} links/sec  {len(new):,} distinct frontier rows")
+    print(f"frontier shrink: {1 - len(new) / len(old):.1%}")
+
+if __name__ == "__main__":
+    main()
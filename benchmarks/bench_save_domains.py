@@ -0,0 +1,82 @@
+import argparse
+import os
+import random
+import string
+import sys
+import time
+import mysql.connector
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import roomba
+from storage import MySQLStorage
+
+# Benchmark database, kept separate from the real domain_scraper data
+BENCH_DB_NAME = 'domain_scraper_bench'
+
+# Create the scratch database and an empty domains table
+def create_bench_db():
+    db = mysql.connector.connect(host=roomba.DB_HOST, user=roomba.DB_USER, password=roomba.DB_PASSWORD)
+    cursor = db.cursor()
+    cursor.execute(f"CREATE DATABASE IF NOT EXISTS {BENCH_DB_NAME}")
+    cursor.execute(f"USE {BENCH_DB_NAME}")
+    cursor.execute("DROP TABLE IF EXISTS domains")
+    cursor.execute("""
+        CREATE TABLE domains (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            domain VARCHAR(255) UNIQUE,
+            crawled ENUM('yes', 'no') DEFAULT 'no',
+            domain_key BINARY(16) UNIQUE
+        )
+    """)
+    db.commit()
+    cursor.close()
+    db.close()
+
+# Generate random domains, reusing some of the known ones to simulate already-seen links
+def make_page_domains(count, known, duplicate_ratio):
+    domains = set()
+    while len(domains) < count:
+        if known and random.random() < duplicate_ratio:
+            domains.add(random.choice(known))
+        else:
+            name = ''.join(random.choices(string.ascii_lowercase + string.digits, k=12))
+            domains.add(f"{name}.{random.choice(['com', 'net', 'org', 'io'])}")
+    return domains
+
+# Time save_domains over a number of simulated pages and return rows/sec
+def run(bulk, pages, links_per_page, duplicate_ratio):
+    create_bench_db()
+    known = []
+    rows = 0
+    added = 0
+    elapsed = 0.0
+    for _ in range(pages):
+        domains = make_page_domains(links_per_page, known, duplicate_ratio)
+        start = time.perf_counter()
+        newly_added = roomba.save_domains(domains, bulk=bulk)
+        elapsed += time.perf_counter() - start
+        rows += len(domains)
+        added += len(newly_added)
+        known.extend(newly_added)
+    return rows, added, elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-row and bulk save_domains throughput")
+    parser.add_argument('--pages', type=int, default=50)
+    parser.add_argument('--links-per-page', type=int, default=300)
+    parser.add_argument('--duplicate-ratio', type=float, default=0.7)
+    args = parser.parse_args()
+
+    # The pool needs the database to exist before it connects
+    create_bench_db()
+    roomba.storage = MySQLStorage(roomba.DB_HOST, roomba.DB_USER, roomba.DB_PASSWORD, BENCH_DB_NAME,
+                                  pool_name="benchpool", pool_size=2)
+
+    for label, bulk in (('per-row', False), ('bulk', True)):
+        random.seed(1)
+        rows, added, elapsed = run(bulk, args.pages, args.links_per_page, args.duplicate_ratio)
+        print(f"{label:8} {rows:,} rows ({added:,} new) in {elapsed:.2f}s -> {rows / elapsed:,.0f} rows/sec")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import argparse
+import asyncio
+import socket
+import struct
+
+# A tiny authoritative-style DNS server for hermetic tests of dns_stage.DnsResolver.
+# Names in the zone answer with their A records; everything else is NXDOMAIN with an SOA.
+
+SOA_RDATA = (b'\x02ns\x04stub\x00' + b'\x05admin\x04stub\x00' + struct.pack('>IIIII', 1, 3600, 600, 86400, 300))
+
+class StubDnsProtocol(asyncio.DatagramProtocol):
+    def __init__(self, zone, ttl=60, drop=(), truncate=()):
+        self.zone = {name.lower(): addresses for name, addresses in zone.items()}
+        self.ttl = ttl
+        self.drop = set(drop)  # Names that never get an answer, to exercise timeouts
+        self.truncate = set(truncate)  # Names answered with the TC bit set and no records
+        self.queries = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.queries += 1
+        query_id, _, _, _, _, _ = struct.unpack('>HHHHHH', data[:12])
+        offset = 12
+        labels = []
+        while data[offset]:
+            length = data[offset]
+            labels.append(data[offset + 1:offset + 1 + length].decode('ascii'))
+            offset += length + 1
+        question = data[12:offset + 5]
+        qtype = struct.unpack('>H', data[offset + 1:offset + 3])[0]
+        name = '.'.join(labels).lower()
+        if name in self.drop:
+            return
+        if name in self.truncate:
+            self.transport.sendto(struct.pack('>HHHHHH', query_id, 0x8380, 1, 0, 0, 0) + question, addr)
+            return
+
+        answers = b''
+        authority = b''
+        ancount = nscount = 0
+        rcode = 0
+        if name in self.zone:
+            for address in self.zone[name]:
+                family, rtype = (socket.AF_INET6, 28) if ':' in address else (socket.AF_INET, 1)
+                if rtype != qtype:
+                    continue
+                rdata = socket.inet_pton(family, address)
+                answers += b'\xc0\x0c' + struct.pack('>HHIH', rtype, 1, self.ttl, len(rdata)) + rdata
+                ancount += 1
+        else:
+            rcode = 3
+        if not ancount:
+            authority = b'\xc0\x0c' + struct.pack('>HHIH', 6, 1, self.ttl, len(SOA_RDATA)) + SOA_RDATA
+            nscount = 1
+
+        header = struct.pack('>HHHHHH', query_id, 0x8180 | rcode, 1, ancount, nscount, 0)
+        self.transport.sendto(header + question + answers + authority, addr)
+
+# Start the stub on the running loop and return (transport, protocol)
+async def start_stub(zone, host='127.0.0.1', port=0, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.create_datagram_endpoint(lambda: StubDnsProtocol(zone, **kwargs), local_addr=(host, port))
+
+async def serve(port, zone):
+    transport, _ = await start_stub(zone, port=port)
+    print(f"Stub resolver listening on 127.0.0.1:{transport.get_extra_info('sockname')[1]}")
+    await asyncio.Event().wait()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a stub DNS server for offline tests")
+    parser.add_argument('--port', type=int, default=5353)
+    parser.add_argument('names', nargs='*', help="name=address entries, e.g. example.com=127.0.0.1")
+    args = parser.parse_args()
+    entries = {}
+    for entry in args.names:
+        name, address = entry.split('=', 1)
+        entries.setdefault(name, []).append(address)
+    asyncio.run(serve(args.port, entries))
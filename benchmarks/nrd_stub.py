@@ -0,0 +1,97 @@
+import argparse
+import hashlib
+import io
+import random
+import string
+import threading
+import zipfile
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# A local stand-in for the whoisds.com NRD index and archive downloads, for hermetic runs of nrd_roomba.py.
+# Archives carry an ETag and Last-Modified and answer conditional GETs with 304.
+
+INDEX_PATH = '/newly-registered-domains'
+ARCHIVE_PATH = '/whois-database/newly-registered-domains/{name}/nrd'
+
+# Build an in-memory zip with one domain-names.txt member, like the real archives
+def make_fixture_zip(domains):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as z:
+        z.writestr('domain-names.txt', '\n'.join(domains) + '\n')
+    return buffer.getvalue()
+
+# Random fixture archives, each reusing a share of the previous one's domains
+def make_fixture_archives(count, domains_per_archive, overlap=0.1):
+    archives = {}
+    previous = []
+    for index in range(count):
+        reused = random.sample(previous, int(len(previous) * overlap)) if previous else []
+        fresh = [''.join(random.choices(string.ascii_lowercase, k=10)) + random.choice(['.com', '.net', '.org', '.xyz'])
+                 for _ in range(domains_per_archive - len(reused))]
+        previous = reused + fresh
+        archives[f"2024-01-{index + 1:02d}.zip"] = make_fixture_zip(previous)
+    return archives
+
+def _handler(archives, stats):
+    etags = {name: '"' + hashlib.sha256(data).hexdigest()[:16] + '"' for name, data in archives.items()}
+    last_modified = formatdate(usegmt=True)
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            with stats['lock']:
+                stats['requests'] += 1
+            if self.path == INDEX_PATH:
+                links = ''.join(f'<a href="{ARCHIVE_PATH.format(name=name)}">{name}</a>\n' for name in archives)
+                self._send(200, f"<html><body>{links}</body></html>".encode(), 'text/html')
+                return
+            for name, data in archives.items():
+                if self.path == ARCHIVE_PATH.format(name=name):
+                    if self.headers.get('If-None-Match') == etags[name]:
+                        with stats['lock']:
+                            stats['not_modified'] += 1
+                        self._send(304, b'', None, etags[name], last_modified)
+                        return
+                    with stats['lock']:
+                        stats['downloads'] += 1
+                    self._send(200, data, 'application/octet-stream', etags[name], last_modified)
+                    return
+            self._send(404, b'not found', 'text/plain')
+
+        def _send(self, status, body, content_type, etag=None, modified=None):
+            self.send_response(status)
+            if content_type:
+                self.send_header('Content-Type', content_type)
+            if etag:
+                self.send_header('ETag', etag)
+            if modified:
+                self.send_header('Last-Modified', modified)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+# Serve the archives on a daemon thread; returns (server, index URL, stats)
+def start_stub(archives, host='127.0.0.1', port=0):
+    stats = {'lock': threading.Lock(), 'requests': 0, 'downloads': 0, 'not_modified': 0}
+    server = ThreadingHTTPServer((host, port), _handler(archives, stats))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}{INDEX_PATH}", stats
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve fixture NRD archives for nrd_roomba.py --index-url")
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--archives', type=int, default=5)
+    parser.add_argument('--domains', type=int, default=100000, help="Domains per archive")
+    args = parser.parse_args()
+    server, index_url, _ = start_stub(make_fixture_archives(args.archives, args.domains), port=args.port)
+    print(f"Serving {args.archives} archives; run: python nrd_roomba.py --index-url {index_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,223 @@
+import argparse
+import asyncio
+import os
+import random
+import string
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from public_suffix import domain_from_url
+from dns_stub import start_stub
+
+# A local farm of virtual hosts for hermetic end-to-end runs of roomba.py and roomba_cms_and_status.py.
+# It is a forward HTTP proxy: point HTTP_PROXY/HTTPS_PROXY at it and every http://host/ request is answered
+# from the host's profile. CONNECT (https) is refused, so https variants fail fast like a host without TLS.
+
+HUB_DOMAIN = 'wikipedia.org'  # roomba's seed domain; links into the farm
+SEED_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'output_target_list.csv')
+
+# Share of hosts per profile
+PROFILE_WEIGHTS = {
+    'links': 0.55,  # Link-dense homepage
+    'cms': 0.15,  # Homepage carrying WordPress/Drupal/Joomla fingerprints
+    'slow': 0.10,  # Link page after a delay
+    'redirect': 0.06,  # Bare domain 301s to www
+    'error': 0.05,  # 500
+    'timeout': 0.02,  # Accepts the request and never answers in time
+    'dead': 0.07,  # No DNS record and refused by the proxy
+}
+SLOW_DELAY = (0.2, 1.5)  # Seconds, uniform
+TIMEOUT_HOLD = 12  # Seconds a timeout host holds the request; above roomba's 10 s and the prober's 5 s
+
+CMS_FINGERPRINTS = {
+    'WordPress': ({'X-Powered-By': 'PHP/8.1.2'},
+                  '<meta name="generator" content="WordPress 6.4.2">\n'
+                  '<link rel="stylesheet" href="/wp-content/themes/twentytwentyfour/style.css?ver=6.4.2">\n'
+                  '<script src="/wp-includes/js/jquery/jquery.min.js?ver=3.7.1"></script>\n'),
+    'Drupal': ({'X-Generator': 'Drupal 10 (https://www.drupal.org)', 'X-Drupal-Cache': 'HIT'},
+               '<meta name="Generator" content="Drupal 10 (https://www.drupal.org)">\n'
+               '<script src="/core/misc/drupal.js?v=10.1.6"></script>\n'),
+    'Joomla': ({},
+               '<meta name="generator" content="Joomla! - Open Source Content Management">\n'
+               '<script src="/media/system/js/core.js"></script>\n'),
+}
+
+# Registrable domains from the seed list, padded with synthetic names
+def farm_hostnames(count, rng, seed_file=SEED_FILE):
+    names = []
+    if seed_file and os.path.exists(seed_file):
+        with open(seed_file) as f:
+            for line in f:
+                domain = domain_from_url(line.strip())
+                if domain and domain not in names and domain != HUB_DOMAIN:
+                    names.append(domain)
+    names = names[:count]
+    while len(names) < count:
+        name = ''.join(rng.choices(string.ascii_lowercase, k=rng.randint(5, 12))) + rng.choice(['.com', '.net', '.org', '.io', '.co.uk'])
+        if name not in names:
+            names.append(name)
+    return names
+
+# Build {host: profile}; every host is reachable from the hub through a chain of links
+def build_farm(hosts=1000, links_per_page=60, seed=1, pages_dir=None, seed_file=SEED_FILE):
+    rng = random.Random(seed)
+    names = farm_hostnames(hosts, rng, seed_file)
+    profiles = list(PROFILE_WEIGHTS)
+    weights = list(PROFILE_WEIGHTS.values())
+    farm = {}
+    for index, name in enumerate(names):
+        kind = rng.choices(profiles, weights)[0]
+        links = rng.sample(names, min(links_per_page, len(names)))
+        if index + 1 < len(names):
+            links.append(names[index + 1])
+        farm[name] = {
+            'kind': kind,
+            'links': links,
+            'delay': rng.uniform(*SLOW_DELAY) if kind == 'slow' else 0.0,
+            'cms': rng.choice(list(CMS_FINGERPRINTS)) if kind == 'cms' else None,
+        }
+    farm[HUB_DOMAIN] = {'kind': 'links', 'links': names[:links_per_page], 'delay': 0.0, 'cms': None}
+
+    # Recorded pages: <pages_dir>/<host>.html is served verbatim for that host
+    if pages_dir:
+        for filename in sorted(os.listdir(pages_dir)):
+            if filename.endswith('.html'):
+                with open(os.path.join(pages_dir, filename), 'rb') as f:
+                    farm[filename[:-len('.html')]] = {'kind': 'recorded', 'body': f.read(), 'links': [], 'delay': 0.0, 'cms': None}
+    return farm
+
+# Hosts that answer DNS: everything except the dead ones. Each host gets its own loopback address, so the
+# politeness scheduler's per-IP limits see separate servers; the traffic itself always goes through the proxy.
+def dns_zone(farm):
+    zone = {}
+    for index, (name, profile) in enumerate(farm.items(), 1):
+        if profile['kind'] != 'dead':
+            address = f"127.{(index >> 16) & 255}.{(index >> 8) & 255}.{index & 255}"
+            zone[name] = [address]
+            zone[f"www.{name}"] = [address]
+    return zone
+
+def render_links_page(name, profile):
+    parts = [f"<html><head><title>{name}</title>\n"]
+    if profile['cms']:
+        parts.append(CMS_FINGERPRINTS[profile['cms']][1])
+    parts.append("</head><body>\n<nav><a href=\"/\">Home</a> <a href=\"/about\">About</a> <a href=\"/contact\">Contact</a></nav>\n<ul>\n")
+    for index, target in enumerate(profile['links']):
+        scheme = 'https' if index % 3 == 0 else 'http'
+        www = 'www.' if index % 4 == 0 else ''
+        parts.append(f'<li><a href="{scheme}://{www}{target}/page/{index}?ref={name}">{target} article {index}</a></li>\n')
+    parts.append("</ul>\n<p>" + "Lorem ipsum dolor sit amet. " * 40 + "</p>\n</body></html>\n")
+    return ''.join(parts).encode()
+
+def _handler(farm, stats):
+    pages = {}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        server_version = 'nginx/1.24.0'  # Instead of BaseHTTP/Python, which Wappalyzer would report for every host
+        sys_version = ''
+
+        def do_CONNECT(self):
+            self._count('connect_refused')
+            self._send(502, b'', 'text/plain', close=True)
+
+        def do_GET(self):
+            # Proxied requests carry an absolute URL; direct ones name the host in the Host header
+            url = urlsplit(self.path)
+            host = (url.hostname or self.headers.get('Host', '').split(':')[0]).lower()
+            bare = host[4:] if host.startswith('www.') else host
+            profile = farm.get(bare)
+            if profile is None or profile['kind'] == 'dead':
+                self._count('unknown_host')
+                self._send(502, b'', 'text/plain', close=True)
+                return
+
+            kind = profile['kind']
+            self._count(kind)
+            if kind == 'timeout':
+                time.sleep(TIMEOUT_HOLD)
+                self.close_connection = True
+                return
+            if kind == 'error':
+                self._send(500, b'internal error', 'text/plain')
+                return
+            if kind == 'redirect' and host == bare:
+                self._send(301, b'', 'text/plain', {'Location': f"http://www.{bare}/"})
+                return
+            if kind == 'recorded':
+                self._send(200, profile['body'], 'text/html; charset=utf-8')
+                return
+            if profile['delay']:
+                time.sleep(profile['delay'])
+            body = pages.get(bare)
+            if body is None:
+                body = pages[bare] = render_links_page(bare, profile)
+            headers = CMS_FINGERPRINTS[profile['cms']][0] if profile['cms'] else {}
+            self._send(200, body, 'text/html; charset=utf-8', headers)
+
+        def _count(self, key):
+            with stats['lock']:
+                stats[key] = stats.get(key, 0) + 1
+
+        def _send(self, status, body, content_type, headers=None, close=False):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            if close:
+                self.send_header('Connection', 'close')
+                self.close_connection = True
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+class FarmServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # The crawler opens up to ASYNC_CONCURRENCY connections at once
+
+    # Clients hang up mid-response all the time (size limits, cancelled probes); that is not an error here
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+# Serve the farm on a daemon thread; returns (server, proxy URL, stats)
+def start_farm(farm, host='127.0.0.1', port=0):
+    stats = {'lock': threading.Lock()}
+    server = FarmServer((host, port), _handler(farm, stats))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}", stats
+
+# Serve the farm and a stub DNS zone for it until the process is killed; ports go back through `ready`.
+# Meant for a separate process so the farm's CPU time is not billed to the code under test.
+def serve_farm_process(farm, ready):
+    server, _, _ = start_farm(farm)
+    loop = asyncio.new_event_loop()
+    transport, _ = loop.run_until_complete(start_stub(dns_zone(farm)))
+    ready.put((server.server_address[1], transport.get_extra_info('sockname')[1]))
+    loop.run_forever()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a farm of fixture hosts as a local HTTP proxy")
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--hosts', type=int, default=1000)
+    parser.add_argument('--links-per-page', type=int, default=60)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--pages-dir', help="Directory of recorded <host>.html pages to serve as-is")
+    args = parser.parse_args()
+    farm = build_farm(args.hosts, args.links_per_page, args.seed, args.pages_dir)
+    server, proxy_url, _ = start_farm(farm, port=args.port)
+    print(f"Serving {len(farm):,} hosts; run with HTTP_PROXY={proxy_url} HTTPS_PROXY={proxy_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -1,15 +1,29 @@
+import argparse
+import heapq
+import itertools
+import pickle
+import resource
+import tempfile
+import time
 import mysql.connector
 from mysql.connector import pooling
 import logging
-import re
-import unicodedata
+from domain_stats import initialize_stats, reconcile
+from normalization import domain_key, initialize_domain_keys, normalize_domain
 
 # Database configuration
 DB_HOST = 'localhost'
 DB_USER = 'root'
 DB_PASSWORD = '1234'
 DB_NAME = 'domain_scraper'
-BATCH_SIZE = 10000  # Number of rows to process in each batch
+BATCH_SIZE = 10000  # Number of rows to process in each batch (offset engine)
+
+# Streaming engine configuration
+STREAM_FETCH_SIZE = 5000  # Rows pulled from the server-side cursor at a time
+WRITE_BATCH_SIZE = 1000  # Ids per bulk DELETE/UPDATE statement
+MAX_KEYS_IN_MEMORY = 20_000_000  # Above this many rows 'auto' spills to an external sort
+SORT_RUN_SIZE = 1_000_000  # Records per sorted run file in external mode
+PROGRESS_EVERY = 100_000  # Rows between progress log lines
 
 # Create a connection pool
 connection_pool = mysql.connector.pooling.MySQLConnectionPool(
@@ -24,29 +38,6 @@ connection_pool = mysql.connector.pooling.MySQLConnectionPool(
 # Initialize logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-# Normalize domain to avoid duplicates
-def normalize_domain(domain):
-    # Remove protocol
-    domain = re.sub(r'^https?://', '', domain, flags=re.IGNORECASE)
-    # Remove "www." prefix
-    domain = re.sub(r'^www\.', '', domain, flags=re.IGNORECASE)
-    # Remove any fragment identifiers or query parameters
-    domain = re.sub(r'#.*$', '', domain)
-    domain = re.sub(r'\?.*$', '', domain)
-    # Remove trailing slashes
-    domain = domain.rstrip('/')
-    # Normalize Unicode to avoid inconsistencies
-    domain = unicodedata.normalize('NFC', domain)
-    # Convert to lowercase
-    domain = domain.lower().strip()
-    # Remove redundant prefixes
-    domain = re.sub(r'^www(\d+)\.', '', domain, flags=re.IGNORECASE)
-    # Handle encoded characters
-    domain = re.sub(r'%[0-9a-fA-F]{2}', lambda x: chr(int(x.group(0)[1:], 16)), domain)
-    # Additional cleaning for unusual subdomains or structures
-    domain = re.sub(r'^wwwwww\.|wwwwww\.|^wwww\.|^wwww\.', '', domain)
-    return domain
-
 def process_batch(offset):
     db = connection_pool.get_connection()
     cursor = db.cursor(dictionary=True)
@@ -87,6 +78,7 @@ def process_batch(offset):
         cursor.close()
         db.close()
 
+# Offset engine: the original batch-by-batch pass (O(N^2/B), and skips rows when it deletes)
 def dedupe_domains():
     offset = 0
 
@@ -106,6 +98,229 @@ def dedupe_domains():
         if offset >= total_domains:
             break
 
+    reconcile_stats()
+
+# Deletes and renames bypass the incremental counters, so recount once at the end
+def reconcile_stats():
+    db = connection_pool.get_connection()
+    initialize_stats(db)
+    reconcile(db)
+    db.close()
+
+# Peak resident memory of this process in MB (ru_maxrss is in KB on Linux)
+def peak_memory_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+# Stream (id, domain, domain_key) ordered by id over its own connection, so the result set is never buffered
+def stream_rows():
+    db = mysql.connector.connect(host=DB_HOST, user=DB_USER, password=DB_PASSWORD, database=DB_NAME)
+    cursor = db.cursor(buffered=False)
+    try:
+        cursor.execute("SELECT id, domain, domain_key FROM domains ORDER BY id")
+        while True:
+            rows = cursor.fetchmany(STREAM_FETCH_SIZE)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        cursor.close()
+        db.close()
+
+def estimated_row_count():
+    db = connection_pool.get_connection()
+    cursor = db.cursor()
+    cursor.execute("""
+        SELECT TABLE_ROWS FROM INFORMATION_SCHEMA.TABLES
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'domains'
+    """)
+    row = cursor.fetchone()
+    cursor.close()
+    db.close()
+    return int(row[0] or 0) if row else 0
+
+class DedupeWriter:
+    """ Applies deletes in bulk batches during the pass, and renames and domain_key backfills after it """
+
+    def __init__(self):
+        self.delete_ids = []
+        self.update_file = tempfile.TemporaryFile()  # Renames wait until every duplicate is gone
+        self.deleted = 0
+        self.updated = 0
+        self.pending_updates = 0
+
+    def delete(self, domain_id):
+        self.delete_ids.append(domain_id)
+        if len(self.delete_ids) >= WRITE_BATCH_SIZE:
+            self.flush_deletes()
+
+    def update(self, domain_id, normalized):
+        pickle.dump((domain_id, normalized), self.update_file)
+        self.pending_updates += 1
+
+    def flush_deletes(self):
+        if not self.delete_ids:
+            return
+        db = connection_pool.get_connection()
+        cursor = db.cursor()
+        try:
+            placeholders = ', '.join(['%s'] * len(self.delete_ids))
+            cursor.execute(f"DELETE FROM domains WHERE id IN ({placeholders})", self.delete_ids)
+            db.commit()
+            self.deleted += cursor.rowcount
+        finally:
+            cursor.close()
+            db.close()
+        self.delete_ids = []
+
+    # Rename kept rows to their normalized form and store their key, one CASE statement per batch
+    def apply_updates(self):
+        self.flush_deletes()
+        self.update_file.seek(0)
+        updates = (pickle.load(self.update_file) for _ in range(self.pending_updates))
+        while True:
+            batch = list(itertools.islice(updates, WRITE_BATCH_SIZE))
+            if not batch:
+                break
+            self._update_batch(batch)
+        self.update_file.close()
+
+    def _update_batch(self, batch):
+        db = connection_pool.get_connection()
+        cursor = db.cursor()
+        try:
+            cases = ' '.join(['WHEN %s THEN %s'] * len(batch))
+            placeholders = ', '.join(['%s'] * len(batch))
+            parameters = [value for pair in batch for value in pair]
+            parameters += [value for domain_id, normalized in batch for value in (domain_id, domain_key(normalized))]
+            parameters += [domain_id for domain_id, _ in batch]
+            cursor.execute(
+                f"UPDATE domains SET domain = CASE id {cases} END, domain_key = CASE id {cases} END WHERE id IN ({placeholders})",
+                parameters
+            )
+            db.commit()
+            self.updated += cursor.rowcount
+        except mysql.connector.IntegrityError:
+            # Some normalized form already exists outside this run's view; fall back to one row at a time
+            db.rollback()
+            for domain_id, normalized in batch:
+                try:
+                    cursor.execute(
+                        "UPDATE domains SET domain = %s, domain_key = %s WHERE id = %s",
+                        (normalized, domain_key(normalized), domain_id)
+                    )
+                    db.commit()
+                    self.updated += cursor.rowcount
+                except mysql.connector.IntegrityError:
+                    db.rollback()
+                    logging.warning(f"Could not rename domain id {domain_id} to {normalized}: already present")
+        finally:
+            cursor.close()
+            db.close()
+
+class Progress:
+    """ Rows/sec and peak memory reporting for the streaming pass """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.rows = 0
+
+    def tick(self):
+        self.rows += 1
+        if self.rows % PROGRESS_EVERY == 0:
+            self.log("Scanned")
+
+    def log(self, label):
+        elapsed = time.perf_counter() - self.start
+        rate = self.rows / elapsed if elapsed else 0.0
+        logging.info(f"{label} {self.rows:,} rows in {elapsed:.1f}s ({rate:,.0f} rows/sec, peak memory {peak_memory_mb():,.0f} MB)")
+
+# In-memory mode: one pass keeping normalized key -> kept id; the lowest id of every key is kept
+def dedupe_in_memory(writer, progress):
+    kept = {}
+    for domain_id, domain, stored_key in stream_rows():
+        progress.tick()
+        normalized = normalize_domain(domain)
+        key = domain_key(normalized)
+        if key in kept:
+            writer.delete(domain_id)
+            continue
+        kept[key] = domain_id
+        if normalized != domain or stored_key != key:
+            writer.update(domain_id, normalized)
+
+# Write (key, id, new domain or None) records to sorted run files
+def _write_runs(progress, directory):
+    runs = []
+    buffer = []
+
+    def spill():
+        buffer.sort()
+        run = tempfile.TemporaryFile(dir=directory)
+        for record in buffer:
+            pickle.dump(record, run)
+        run.seek(0)
+        runs.append((run, len(buffer)))
+        buffer.clear()
+
+    for domain_id, domain, stored_key in stream_rows():
+        progress.tick()
+        normalized = normalize_domain(domain)
+        key = domain_key(normalized)
+        buffer.append((key, domain_id, normalized if normalized != domain or stored_key != key else None))
+        if len(buffer) >= SORT_RUN_SIZE:
+            spill()
+    if buffer:
+        spill()
+    return runs
+
+def _read_run(run, count):
+    for _ in range(count):
+        yield pickle.load(run)
+    run.close()
+
+# External mode: sorted runs on disk merged by key, so memory stays bounded by SORT_RUN_SIZE
+def dedupe_external(writer, progress, directory=None):
+    runs = _write_runs(progress, directory)
+    logging.info(f"Merging {len(runs)} sorted runs")
+    merged = heapq.merge(*(_read_run(run, count) for run, count in runs))
+    for _, group in itertools.groupby(merged, key=lambda record: record[0]):
+        _, kept_id, normalized = next(group)  # Lowest id first, since records sort by (key, id)
+        if normalized is not None:
+            writer.update(kept_id, normalized)
+        for _, domain_id, _ in group:
+            writer.delete(domain_id)
+
+# Streaming engine: a single ordered pass with bulk deletes, renames applied once the duplicates are gone
+def dedupe_domains_streaming(mode='auto', spill_dir=None):
+    db = connection_pool.get_connection()
+    initialize_domain_keys(db)
+    db.close()
+    if mode == 'auto':
+        mode = 'external' if estimated_row_count() > MAX_KEYS_IN_MEMORY else 'memory'
+    logging.info(f"Streaming dedupe in {mode} mode")
+    writer = DedupeWriter()
+    progress = Progress()
+    if mode == 'external':
+        dedupe_external(writer, progress, spill_dir)
+    else:
+        dedupe_in_memory(writer, progress)
+    writer.flush_deletes()
+    progress.log("Scanned")
+    writer.apply_updates()
+    logging.info(f"Deleted {writer.deleted:,} duplicates and normalized {writer.updated:,} domains")
+    progress.log("Finished")
+    reconcile_stats()
+
 if __name__ == "__main__":
-    dedupe_domains()
+    parser = argparse.ArgumentParser(description="Remove duplicate domains and store their normalized form")
+    parser.add_argument('--engine', choices=['stream', 'offset'], default='stream',
+                        help="stream: one ordered pass with bulk writes; offset: the original LIMIT/OFFSET batches")
+    parser.add_argument('--mode', choices=['auto', 'memory', 'external'], default='auto',
+                        help="Streaming engine: keep the key map in memory or spill to an external sort")
+    parser.add_argument('--spill-dir', help="Directory for external sort runs (default: the system temp dir)")
+    args = parser.parse_args()
+    if args.engine == 'offset':
+        dedupe_domains()
+    else:
+        dedupe_domains_streaming(args.mode, args.spill_dir)
     logging.info("Domain deduplication and normalization complete.")
@@ -0,0 +1,258 @@
+import asyncio
+import collections
+import logging
+import random
+import socket
+import struct
+import time
+import aiohttp
+
+# DNS stage configuration
+DNS_NAMESERVER = None  # (host, port); None reads the first nameserver from /etc/resolv.conf
+DNS_TIMEOUT = 2  # Seconds to wait for an answer before retrying
+DNS_RETRIES = 2  # Retries after the first attempt
+DNS_CONCURRENCY = 500  # Queries in flight at once
+MIN_TTL = 30  # Clamp for positive answers
+MAX_TTL = 3600
+NEGATIVE_TTL = 900  # Used for NXDOMAIN/NODATA when the answer carries no SOA
+DNS_CACHE_SIZE = 100000  # Names kept in the cache; the least recently used go first, expired or not
+
+# Resolution outcomes
+RESOLVED = 'resolved'
+NXDOMAIN = 'nxdomain'
+NODATA = 'nodata'
+ERROR = 'error'  # Timeouts and server failures; never cached, the HTTP stage still runs
+
+TYPE_A = 1
+TYPE_SOA = 6
+TYPE_AAAA = 28
+RCODE_NXDOMAIN = 3
+FLAG_TC = 0x0200  # Truncated; the full answer only comes over TCP
+
+# First nameserver listed in /etc/resolv.conf
+def system_nameserver(path='/etc/resolv.conf'):
+    try:
+        with open(path) as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0] == 'nameserver':
+                    return parts[1], 53
+    except OSError:
+        pass
+    return '127.0.0.1', 53
+
+def build_query(query_id, name, qtype):
+    header = struct.pack('>HHHHHH', query_id, 0x0100, 1, 0, 0, 0)  # Recursion desired, one question
+    qname = b''.join(bytes([len(label)]) + label for label in name.encode('idna').split(b'.') if label) + b'\0'
+    return header + qname + struct.pack('>HH', qtype, 1)
+
+# Skip over a possibly compressed name, returning the offset after it
+def _skip_name(data, offset):
+    while True:
+        length = data[offset]
+        if length == 0:
+            return offset + 1
+        if length & 0xC0 == 0xC0:
+            return offset + 2
+        offset += length + 1
+
+# Parse a response into (rcode, [(address, ttl)], negative ttl)
+def parse_response(data, qtype):
+    _, flags, qdcount, ancount, nscount, _ = struct.unpack('>HHHHHH', data[:12])
+    rcode = flags & 0x000F
+    offset = 12
+    for _ in range(qdcount):
+        offset = _skip_name(data, offset) + 4
+
+    addresses = []
+    negative_ttl = None
+    for index in range(ancount + nscount):
+        offset = _skip_name(data, offset)
+        rtype, _, ttl, rdlength = struct.unpack('>HHIH', data[offset:offset + 10])
+        offset += 10
+        rdata = data[offset:offset + rdlength]
+        offset += rdlength
+        if index < ancount and rtype == qtype == TYPE_A and rdlength == 4:
+            addresses.append((socket.inet_ntop(socket.AF_INET, rdata), ttl))
+        elif index < ancount and rtype == qtype == TYPE_AAAA and rdlength == 16:
+            addresses.append((socket.inet_ntop(socket.AF_INET6, rdata), ttl))
+        elif index >= ancount and rtype == TYPE_SOA and rdlength >= 20:
+            # The SOA minimum is the last field of the record
+            minimum = struct.unpack('>I', rdata[-4:])[0]
+            negative_ttl = min(ttl, minimum)
+    return rcode, addresses, negative_ttl
+
+class _DnsProtocol(asyncio.DatagramProtocol):
+    """ Matches UDP responses to pending queries by id """
+
+    def __init__(self):
+        self.pending = {}
+
+    def datagram_received(self, data, addr):
+        if len(data) < 12:
+            return
+        query_id = struct.unpack('>H', data[:2])[0]
+        future = self.pending.pop(query_id, None)
+        if future is not None and not future.done():
+            future.set_result(data)
+
+    def error_received(self, exc):
+        logging.debug(f"DNS socket error: {exc}")
+
+class DnsResult:
+    """ Outcome of resolving one name """
+
+    def __init__(self, status, addresses=(), ttl=0):
+        self.status = status
+        self.addresses = list(addresses)
+        self.expires = time.monotonic() + ttl
+
+    def is_dead(self):
+        return self.status in (NXDOMAIN, NODATA)
+
+class DnsResolver:
+    """ Async bulk resolver with a bounded, TTL-aware positive and negative LRU cache """
+
+    def __init__(self, nameserver=None, timeout=DNS_TIMEOUT, retries=DNS_RETRIES, concurrency=DNS_CONCURRENCY,
+                 cache_size=DNS_CACHE_SIZE):
+        self.nameserver = nameserver or DNS_NAMESERVER or system_nameserver()
+        self.timeout = timeout
+        self.retries = retries
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.cache = collections.OrderedDict()  # name -> DnsResult, least recently used first
+        self.cache_size = cache_size
+        self.in_flight = {}  # name -> task of the lookup every concurrent caller for that name waits on
+        self.transport = None
+        self.protocol = None
+        self.open_lock = asyncio.Lock()
+        self.stats = {'queries': 0, 'cache_hits': 0, 'shared': 0, 'resolved': 0, 'dead': 0, 'errors': 0}
+
+    async def open(self):
+        async with self.open_lock:
+            if self.transport is None:
+                loop = asyncio.get_running_loop()
+                self.transport, self.protocol = await loop.create_datagram_endpoint(_DnsProtocol, remote_addr=self.nameserver)
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
+
+    async def _query(self, name, qtype):
+        loop = asyncio.get_running_loop()
+        for _ in range(self.retries + 1):
+            query_id = random.randrange(65536)
+            while query_id in self.protocol.pending:
+                query_id = random.randrange(65536)
+            future = loop.create_future()
+            self.protocol.pending[query_id] = future
+            self.stats['queries'] += 1
+            self.transport.sendto(build_query(query_id, name, qtype))
+            try:
+                data = await asyncio.wait_for(future, self.timeout)
+                if struct.unpack('>H', data[2:4])[0] & FLAG_TC:
+                    # A partial answer; there is no TCP fallback, so report an error rather than cache it
+                    return None
+                return parse_response(data, qtype)
+            except asyncio.TimeoutError:
+                self.protocol.pending.pop(query_id, None)
+            except (struct.error, IndexError):
+                return None
+        return None
+
+    # Resolve one name to A (then AAAA) records, consulting the cache first
+    async def resolve(self, name):
+        name = name.lower().rstrip('.')
+        cached = self.cache.get(name)
+        if cached is not None:
+            if cached.expires > time.monotonic():
+                self.stats['cache_hits'] += 1
+                self.cache.move_to_end(name)
+                return cached
+            del self.cache[name]
+
+        # Concurrent callers for the same name share one lookup; shielded so a cancelled caller does not cancel it for the rest
+        task = self.in_flight.get(name)
+        if task is not None:
+            self.stats['shared'] += 1
+        else:
+            task = self.in_flight[name] = asyncio.ensure_future(self._lookup(name))
+            task.add_done_callback(lambda _: self.in_flight.pop(name, None))
+        return await asyncio.shield(task)
+
+    async def _lookup(self, name):
+        if self.transport is None:
+            await self.open()
+
+        async with self.semaphore:
+            answer = await self._query(name, TYPE_A)
+            if answer is not None and answer[0] == 0 and not answer[1]:
+                aaaa = await self._query(name, TYPE_AAAA)
+                if aaaa is not None and aaaa[0] == 0:
+                    answer = aaaa
+
+        if answer is None or answer[0] not in (0, RCODE_NXDOMAIN):
+            self.stats['errors'] += 1
+            return DnsResult(ERROR)
+
+        rcode, addresses, negative_ttl = answer
+        if addresses:
+            ttl = max(MIN_TTL, min(MAX_TTL, min(ttl for _, ttl in addresses)))
+            result = DnsResult(RESOLVED, [address for address, _ in addresses], ttl)
+            self.stats['resolved'] += 1
+        else:
+            ttl = min(MAX_TTL, negative_ttl if negative_ttl is not None else NEGATIVE_TTL)
+            result = DnsResult(NXDOMAIN if rcode == RCODE_NXDOMAIN else NODATA, ttl=ttl)
+            self.stats['dead'] += 1
+        # A full scan of the table sees every name once; bound the cache instead of keeping them all
+        self.cache[name] = result
+        self.cache.move_to_end(name)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return result
+
+    # Resolve many names concurrently, returning {name: DnsResult}
+    async def resolve_many(self, names):
+        results = await asyncio.gather(*(self.resolve(name) for name in names))
+        return dict(zip(names, results))
+
+    # A domain is dead only when neither the apex nor the www host has an address
+    async def domain_is_dead(self, domain):
+        apex = await self.resolve(domain)
+        if not apex.is_dead():
+            return False
+        www = await self.resolve(f"www.{domain}")
+        return www.is_dead()
+
+    # Split domains into (live or unknown, dead) using bulk resolution
+    async def partition(self, domains):
+        dead_flags = await asyncio.gather(*(self.domain_is_dead(domain) for domain in domains))
+        live = [domain for domain, dead in zip(domains, dead_flags) if not dead]
+        dead = [domain for domain, dead in zip(domains, dead_flags) if dead]
+        return live, dead
+
+class CachedResolver(aiohttp.abc.AbstractResolver):
+    """ aiohttp resolver that reuses the DNS stage's cache for the HTTP probes """
+
+    def __init__(self, dns_resolver):
+        self.dns_resolver = dns_resolver
+        self.fallback = aiohttp.ThreadedResolver()
+
+    async def resolve(self, host, port=0, family=socket.AF_INET):
+        result = await self.dns_resolver.resolve(host)
+        if result.status != RESOLVED:
+            return await self.fallback.resolve(host, port, family)
+        return [
+            {
+                'hostname': host,
+                'host': address,
+                'port': port,
+                'family': socket.AF_INET6 if ':' in address else socket.AF_INET,
+                'proto': 0,
+                'flags': socket.AI_NUMERICHOST,
+            }
+            for address in result.addresses
+        ]
+
+    async def close(self):
+        await self.fallback.close()
@@ -0,0 +1,177 @@
+import argparse
+import logging
+import sqlite3
+import threading
+import time
+import mysql.connector
+
+# Database configuration
+DB_HOST = 'localhost'
+DB_USER = 'root'
+DB_PASSWORD = '1234'
+DB_NAME = 'domain_scraper'
+
+# Counters configuration
+STATS_FLUSH_INTERVAL = 2  # Seconds between counter flushes
+
+# Full-count queries, only run by reconcile()
+RECONCILE_QUERIES = {
+    'total': "SELECT COUNT(*) FROM domains",
+    'crawled': "SELECT COUNT(*) FROM domains WHERE crawled='yes'",
+    'uncrawled': "SELECT COUNT(*) FROM domains WHERE crawled='no'",
+    'processed': "SELECT COUNT(*) FROM domains WHERE status_flags IS NOT NULL",
+    'reachable': "SELECT COUNT(*) FROM domains WHERE status_flags > 0",
+    'cms_detected': "SELECT COUNT(DISTINCT domain_id) FROM domain_technologies",
+}
+
+# Rows still holding only the old domain_status/cms text, added on top until probe_schema.py has backfilled them
+LEGACY_RECONCILE_QUERIES = {
+    'processed': "SELECT COUNT(*) FROM domains WHERE status_flags IS NULL AND domain_status IS NOT NULL",
+    'reachable': "SELECT COUNT(*) FROM domains WHERE status_flags IS NULL AND domain_status IS NOT NULL AND domain_status != ''",
+    'cms_detected': "SELECT COUNT(*) FROM domains WHERE status_flags IS NULL AND cms IS NOT NULL AND cms != 'N/A'",
+}
+
+# Create the counters table, reconciling it from full counts the first time
+def initialize_stats(db):
+    cursor = db.cursor()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS domain_stats (
+            name VARCHAR(64) PRIMARY KEY,
+            value BIGINT NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("SELECT COUNT(*) FROM domain_stats")
+    empty = cursor.fetchone()[0] == 0
+    db.commit()
+    cursor.close()
+    if empty:
+        reconcile(db)
+
+# Columns and tables that only exist once roomba_cms_and_status.py has initialized the schema
+def _existing_columns(cursor):
+    cursor.execute("""
+        SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'domains'
+    """)
+    columns = {row[0] for row in cursor.fetchall()}
+    cursor.execute("""
+        SELECT TABLE_NAME FROM INFORMATION_SCHEMA.TABLES
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'domain_technologies'
+    """)
+    if cursor.fetchone() is not None:
+        columns.add('domain_technologies')
+    return columns
+
+# Replace every counter with a full count of the domains table
+def reconcile(db):
+    cursor = db.cursor()
+    columns = _existing_columns(cursor)
+    values = {}
+    for name, query in RECONCILE_QUERIES.items():
+        if ('status_flags' in query and 'status_flags' not in columns) or \
+                ('domain_technologies' in query and 'domain_technologies' not in columns):
+            values[name] = 0
+        else:
+            cursor.execute(query)
+            values[name] = cursor.fetchone()[0]
+        if name in LEGACY_RECONCILE_QUERIES and 'domain_status' in columns:
+            legacy_query = LEGACY_RECONCILE_QUERIES[name]
+            if 'status_flags' not in columns:
+                legacy_query = legacy_query.replace('status_flags IS NULL AND ', '')
+            cursor.execute(legacy_query)
+            values[name] += cursor.fetchone()[0]
+    cursor.close()
+    write_absolute(db, values)
+    logging.info(f"Reconciled domain stats: {values}")
+    return values
+
+# Overwrite counters with known values
+def write_absolute(db, values):
+    cursor = db.cursor()
+    cursor.executemany(
+        "INSERT INTO domain_stats (name, value) VALUES (%s, %s) ON DUPLICATE KEY UPDATE value = VALUES(value)",
+        list(values.items())
+    )
+    db.commit()
+    cursor.close()
+
+# Read every counter with one query over the tiny stats table
+def read_stats(db):
+    cursor = db.cursor()
+    cursor.execute("SELECT name, value FROM domain_stats")
+    values = {name: 0 for name in RECONCILE_QUERIES}
+    values.update({name: int(value) for name, value in cursor.fetchall()})
+    cursor.close()
+    return values
+
+class StatsCounters:
+    """ In-process counter deltas, flushed to domain_stats periodically by a background thread """
+
+    def __init__(self, connect=None, flush_interval=STATS_FLUSH_INTERVAL, apply=None):
+        self.connect = connect  # Returns a connection, e.g. a pool's get_connection
+        self.apply = apply  # Or a callable taking the deltas dict, e.g. a storage backend's add_stats
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.deltas = {}
+        self.thread = None
+
+    def add(self, name, delta=1):
+        if not delta:
+            return
+        with self.lock:
+            self.deltas[name] = self.deltas.get(name, 0) + delta
+
+    def flush(self):
+        with self.lock:
+            deltas, self.deltas = self.deltas, {}
+        deltas = {name: delta for name, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        try:
+            if self.apply is not None:
+                self.apply(deltas)
+            else:
+                self._write(deltas)
+        except (mysql.connector.Error, sqlite3.Error) as err:
+            logging.error(f"Failed to flush domain stats: {err}")
+            # Keep the deltas for the next flush
+            for name, delta in deltas.items():
+                self.add(name, delta)
+
+    def _write(self, deltas):
+        db = self.connect()
+        cursor = db.cursor()
+        try:
+            cursor.executemany(
+                "INSERT INTO domain_stats (name, value) VALUES (%s, %s) ON DUPLICATE KEY UPDATE value = value + VALUES(value)",
+                list(deltas.items())
+            )
+            db.commit()
+        finally:
+            cursor.close()
+            db.close()
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return self
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Show or reconcile the domain_stats counters")
+    parser.add_argument('--reconcile', action='store_true', help="Recompute every counter with full COUNT(*) scans")
+    args = parser.parse_args()
+
+    db = mysql.connector.connect(host=DB_HOST, user=DB_USER, password=DB_PASSWORD, database=DB_NAME)
+    initialize_stats(db)
+    if args.reconcile:
+        reconcile(db)
+    for name, value in read_stats(db).items():
+        print(f"{name}: {value:,}")
+    db.close()
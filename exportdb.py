@@ -1,5 +1,18 @@
+import argparse
+import csv
+import datetime
+import gzip
+import json
+import os
+import time
 import mysql.connector
-import pandas as pd
+from mysql.connector.constants import FieldType
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # Parquet export is optional
+    pyarrow = None
 
 # Database configuration
 DB_HOST = 'localhost'
@@ -8,6 +21,13 @@ DB_PASSWORD = '1234'
 DB_NAME = 'domain_scraper'
 CSV_FILE = 'domains_export.csv'
 
+# Export configuration
+EXPORT_CHUNK_SIZE = 10000  # Rows fetched from the server-side cursor and written at a time
+WATERMARK_FILE = 'export_watermark.json'  # Last exported id/timestamp per export name
+FORMATS = {'csv': '.csv', 'csv.gz': '.csv.gz', 'jsonl': '.jsonl', 'jsonl.gz': '.jsonl.gz', 'parquet': '.parquet'}
+INTEGER_FIELD_TYPES = {FieldType.TINY, FieldType.SHORT, FieldType.INT24, FieldType.LONG, FieldType.LONGLONG, FieldType.YEAR, FieldType.BIT}
+FLOAT_FIELD_TYPES = {FieldType.FLOAT, FieldType.DOUBLE, FieldType.DECIMAL, FieldType.NEWDECIMAL}
+
 # Connect to MySQL
 def connect_db():
     return mysql.connector.connect(
@@ -17,14 +37,181 @@ def connect_db():
         database=DB_NAME
     )
 
+# Make a value safe for CSV/JSON: binary keys as hex, timestamps as ISO 8601
+def plain_value(value):
+    if isinstance(value, (bytes, bytearray)):
+        return value.hex()
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return value
+
+class CsvExportWriter:
+    def __init__(self, path, columns, compress=False):
+        self.file = gzip.open(path, 'wt', newline='', encoding='utf-8') if compress else open(path, 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(columns)
+
+    def write_rows(self, rows):
+        self.writer.writerows([plain_value(value) for value in row] for row in rows)
+
+    def close(self):
+        self.file.close()
+
+class JsonlExportWriter:
+    def __init__(self, path, columns, compress=False):
+        self.file = gzip.open(path, 'wt', encoding='utf-8') if compress else open(path, 'w', encoding='utf-8')
+        self.columns = columns
+
+    def write_rows(self, rows):
+        self.file.writelines(
+            json.dumps({column: plain_value(value) for column, value in zip(self.columns, row)}) + '\n' for row in rows
+        )
+
+    def close(self):
+        self.file.close()
+
+# Parquet type of a column from its cursor.description type code; everything that is not a number is written as text
+def parquet_type(type_code):
+    if type_code in INTEGER_FIELD_TYPES:
+        return pyarrow.int64()
+    if type_code in FLOAT_FIELD_TYPES:
+        return pyarrow.float64()
+    return pyarrow.string()
+
+def parquet_value(value, value_type):
+    if value is None or value_type == pyarrow.int64():
+        return value
+    if value_type == pyarrow.float64():
+        return float(value)
+    return str(plain_value(value))
+
+class ParquetExportWriter:
+    """ Columnar output; each chunk becomes a row group """
+
+    def __init__(self, path, columns, field_types, compress=True):
+        if pyarrow is None:
+            raise SystemExit("Parquet export needs pyarrow (pip install pyarrow)")
+        self.path = path
+        self.columns = columns
+        # Fixed from the column types, not inferred per chunk: a column that is all NULL in the first chunk would
+        # otherwise get type null and every later chunk with values would fail to match it
+        self.schema = pyarrow.schema([(column, parquet_type(type_code)) for column, type_code in zip(columns, field_types)])
+        self.writer = None
+
+    def write_rows(self, rows):
+        data = {
+            field.name: [parquet_value(row[index], field.type) for row in rows]
+            for index, field in enumerate(self.schema)
+        }
+        table = pyarrow.table(data, schema=self.schema)
+        if self.writer is None:
+            self.writer = pyarrow.parquet.ParquetWriter(self.path, self.schema, compression='zstd')
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+# field_types are the type codes from cursor.description, which Parquet needs for its schema
+def open_writer(path, columns, field_types, export_format):
+    if export_format == 'parquet':
+        return ParquetExportWriter(path, columns, field_types)
+    writer_class = JsonlExportWriter if export_format.startswith('jsonl') else CsvExportWriter
+    return writer_class(path, columns, compress=export_format.endswith('.gz'))
+
+def load_watermarks(path=WATERMARK_FILE):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def save_watermarks(watermarks, path=WATERMARK_FILE):
+    temporary = f"{path}.tmp"
+    with open(temporary, 'w') as f:
+        json.dump(watermarks, f, indent=2)
+    os.replace(temporary, path)
+
+# Build the keyset query: everything, or only rows past the watermark on the id or a timestamp column
+def export_query(watermark_column, watermark):
+    if watermark_column == 'id':
+        return "SELECT * FROM domains WHERE id > %s ORDER BY id", (watermark['id'] if watermark else 0,)
+    if watermark:
+        # (column, id) ordering so rows sharing a timestamp are neither skipped nor repeated
+        return (f"SELECT * FROM domains WHERE {watermark_column} > %s OR ({watermark_column} = %s AND id > %s) "
+                f"ORDER BY {watermark_column}, id", (watermark['value'], watermark['value'], watermark['id']))
+    return f"SELECT * FROM domains WHERE {watermark_column} IS NOT NULL ORDER BY {watermark_column}, id", ()
+
+# Stream the domains table to one or more files without materializing it; returns the number of rows written
+def export_domains(output='domains_export', export_format='csv', shards=1, incremental=False, watermark_column='id'):
+    if not watermark_column.isidentifier():
+        raise SystemExit(f"Invalid watermark column: {watermark_column}")
+    watermarks = load_watermarks()
+    name = f"{output}:{watermark_column}"
+    watermark = watermarks.get(name) if incremental else None
+    query, parameters = export_query(watermark_column, watermark)
+
+    suffix = FORMATS[export_format]
+    if incremental:
+        output = f"{output}.{datetime.datetime.now():%Y%m%dT%H%M%S}"
+    paths = [f"{output}{suffix}"] if shards == 1 else [f"{output}.part{shard:03d}{suffix}" for shard in range(shards)]
+
+    start = time.perf_counter()
+    db = connect_db()
+    cursor = db.cursor(buffered=False)  # Server-side streaming: rows arrive as they are fetched
+    writers = []
+    rows_written = 0
+    last_row = None
+    try:
+        cursor.execute(query, parameters)
+        columns = [column[0] for column in cursor.description]
+        field_types = [column[1] for column in cursor.description]
+        id_index = columns.index('id')
+        value_index = columns.index(watermark_column)
+        writers = [open_writer(path, columns, field_types, export_format) for path in paths]
+        while True:
+            rows = cursor.fetchmany(EXPORT_CHUNK_SIZE)
+            if not rows:
+                break
+            if shards == 1:
+                writers[0].write_rows(rows)
+            else:
+                by_shard = [[] for _ in range(shards)]
+                for row in rows:
+                    by_shard[row[id_index] % shards].append(row)
+                for writer, shard_rows in zip(writers, by_shard):
+                    if shard_rows:
+                        writer.write_rows(shard_rows)
+            rows_written += len(rows)
+            last_row = rows[-1]
+    finally:
+        for writer in writers:
+            writer.close()
+        cursor.close()
+        db.close()
+
+    # Only move the watermark once every file has been written and closed
+    if last_row is not None:
+        watermarks[name] = {'id': last_row[id_index], 'value': plain_value(last_row[value_index])}
+        save_watermarks(watermarks)
+
+    elapsed = time.perf_counter() - start
+    rate = rows_written / elapsed if elapsed else 0.0
+    print(f"Exported {rows_written:,} rows to {', '.join(paths)} in {elapsed:.1f}s ({rate:,.0f} rows/sec)")
+    return rows_written
+
 # Export domains table to CSV
 def export_to_csv():
-    db = connect_db()
-    query = "SELECT * FROM domains"
-    df = pd.read_sql(query, db)
-    df.to_csv(CSV_FILE, index=False)
-    db.close()
-    print(f"Exported data to {CSV_FILE}")
+    export_domains(CSV_FILE[:-len('.csv')], 'csv')
 
 if __name__ == "__main__":
-    export_to_csv()
+    parser = argparse.ArgumentParser(description="Stream the domains table to CSV, JSONL or Parquet")
+    parser.add_argument('--output', default='domains_export', help="Output path without extension")
+    parser.add_argument('--format', choices=list(FORMATS), default='csv')
+    parser.add_argument('--shards', type=int, default=1, help="Split rows across N files by id")
+    parser.add_argument('--incremental', action='store_true',
+                        help=f"Only export rows past the watermark stored in {WATERMARK_FILE}, to a timestamped file")
+    parser.add_argument('--watermark-column', default='id',
+                        help="Column the incremental watermark follows: id, or a timestamp column such as checked_at")
+    args = parser.parse_args()
+    export_domains(args.output, args.format, max(1, args.shards), args.incremental, args.watermark_column)
@@ -0,0 +1,150 @@
+import logging
+import os
+import socket
+import threading
+import time
+from collections import deque
+from metrics import error_cause, metrics
+
+# Frontier configuration
+CLAIM_BATCH_SIZE = 25  # Number of domains leased per claim transaction
+LEASE_SECONDS = 900  # Leases older than this are handed out again
+
+# Add the lease columns and index used by the frontier if they are missing
+def initialize_frontier(db):
+    cursor = db.cursor()
+    columns = {
+        'lease_owner': "VARCHAR(64) DEFAULT NULL",
+        'lease_expires': "DATETIME DEFAULT NULL",
+    }
+    for column, definition in columns.items():
+        cursor.execute("""
+            SELECT COLUMN_NAME
+            FROM INFORMATION_SCHEMA.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'domains' AND COLUMN_NAME = %s
+        """, (column,))
+        if cursor.fetchone() is None:
+            cursor.execute(f"ALTER TABLE domains ADD COLUMN {column} {definition}")
+
+    cursor.execute("""
+        SELECT INDEX_NAME
+        FROM INFORMATION_SCHEMA.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'domains' AND INDEX_NAME = 'idx_frontier'
+    """)
+    if cursor.fetchone() is None:
+        cursor.execute("ALTER TABLE domains ADD INDEX idx_frontier (crawled, lease_expires)")
+
+    db.commit()
+    cursor.close()
+
+# Build a lease owner name that identifies the host, process and worker
+def lease_owner_name(worker_id):
+    return f"{socket.gethostname()}:{os.getpid()}:{worker_id}"[:64]
+
+class ClaimStats:
+    """ Thread-safe latency counters for frontier claim transactions """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.claims = 0
+        self.claimed_domains = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.last_seconds = 0.0
+
+    def record(self, seconds, claimed):
+        with self.lock:
+            self.claims += 1
+            self.claimed_domains += claimed
+            self.total_seconds += seconds
+            self.last_seconds = seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+
+    def snapshot(self):
+        with self.lock:
+            average = self.total_seconds / self.claims if self.claims else 0.0
+            per_claim = self.claimed_domains / self.claims if self.claims else 0.0
+            return {
+                'claims': self.claims,
+                'claimed_domains': self.claimed_domains,
+                'avg_ms': average * 1000,
+                'last_ms': self.last_seconds * 1000,
+                'max_ms': self.max_seconds * 1000,
+                'domains_per_claim': per_claim,
+            }
+
+# Shared by every frontier in the process so the dashboard can show claim latency
+claim_stats = ClaimStats()
+
+class Frontier:
+    """ Leases batches of uncrawled domains to a single worker """
+
+    def __init__(self, storage, owner, batch_size=CLAIM_BATCH_SIZE, lease_seconds=LEASE_SECONDS, stats=claim_stats, counters=None,
+                 key_range=None):
+        self.storage = storage  # A storage.MySQLStorage or storage.SQLiteStorage
+        self.key_range = key_range  # Optional sharding.shard_key_range(); only domains in that partition are claimed
+        self.owner = owner
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.stats = stats
+        self.counters = counters  # Optional domain_stats.StatsCounters, told about newly crawled rows
+        self.pending = deque()
+        self.completed = []
+        self.completed_lock = threading.Lock()  # complete() may run on a different thread than claim()
+
+    # Return the next leased (id, domain) pair, claiming a new batch when the local one is empty
+    def next_domain(self):
+        if not self.pending:
+            self.claim()
+        if self.pending:
+            return self.pending.popleft()
+        return None
+
+    # Mark a domain as crawled; written together with the next claim
+    def complete(self, domain_id):
+        with self.completed_lock:
+            self.completed.append(domain_id)
+
+    # Claim up to batch_size domains in one transaction, flushing completed ones first
+    def claim(self):
+        start = time.perf_counter()
+        completed = self._take_completed()
+        try:
+            claimed, crawled = self.storage.claim(self.owner, completed, self.batch_size, self.lease_seconds, self.key_range)
+            self._count_crawled(crawled)
+        except self.storage.errors as err:
+            metrics.inc('errors_total', stage='claim', cause=error_cause(err))
+            logging.error(f"Database error while claiming domains: {err}")
+            self._restore_completed(completed)
+            claimed = []
+
+        elapsed = time.perf_counter() - start
+        self.stats.record(elapsed, len(claimed))
+        metrics.observe('stage_seconds', elapsed, stage='claim')
+        self.pending.extend(claimed)
+        return len(claimed)
+
+    # Write completed domains and hand unprocessed leases back to the frontier
+    def release(self):
+        completed = self._take_completed()
+        try:
+            crawled = self.storage.release(self.owner, completed, [domain_id for domain_id, _ in self.pending])
+            self._count_crawled(crawled)
+            self.pending.clear()
+        except self.storage.errors as err:
+            logging.error(f"Database error while releasing leases: {err}")
+            self._restore_completed(completed)
+
+    def _take_completed(self):
+        with self.completed_lock:
+            completed, self.completed = self.completed, []
+        return completed
+
+    def _restore_completed(self, completed):
+        with self.completed_lock:
+            self.completed.extend(completed)
+
+    def _count_crawled(self, crawled):
+        if self.counters is not None and crawled:
+            self.counters.add('crawled', crawled)
+            self.counters.add('uncrawled', -crawled)
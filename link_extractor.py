@@ -0,0 +1,176 @@
+import codecs
+import html
+import re
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+
+# Link extraction configuration
+LINK_ENGINE = 'regex'  # 'regex' (streaming tokenizer), 'htmlparser' (incremental html.parser) or 'bs4' (full tree)
+MAX_CARRY = 64 * 1024  # Longest unterminated tag kept between chunks
+SKIP_CARRY = 16  # Characters kept between chunks while skipping, enough for a split end marker
+
+# An a[href], or the start of a comment or a script/style body, whose contents hold no links.
+# href must follow whitespace so data-href and similar attributes do not match.
+TOKEN_RE = re.compile(
+    r"""(?P<comment><!--)|<(?P<raw>script|style)\b[^>]*>"""
+    r"""|<a\s(?:[^>]*?\s)?href\s*=\s*(?:"(?P<double>[^"]*)"|'(?P<single>[^']*)'|(?P<bare>[^\s"'>]+))""",
+    re.IGNORECASE
+)
+SKIP_END_RES = {
+    'comment': re.compile(r'-->'),
+    'script': re.compile(r'</script\b[^>]*>', re.IGNORECASE),
+    'style': re.compile(r'</style\b[^>]*>', re.IGNORECASE),
+}
+
+# Resolve an href against the page URL, keeping only http(s) links
+def absolute_link(base_url, href):
+    href = href.strip()
+    if '&' in href:
+        href = html.unescape(href)
+    if href.startswith(('http://', 'https://')):
+        return href
+    if not href or href.startswith('#'):
+        return None
+    link = urljoin(base_url, href)
+    if link.startswith(('http://', 'https://')):
+        return link
+    return None
+
+class _RegexTokenizer:
+    """ Scans decoded text with a compiled regex, carrying unterminated tags between chunks and
+    skipping comments and script/style bodies the way html.parser does """
+
+    def __init__(self):
+        self.carry = ''
+        self.skip_end = None  # End marker of the comment or script/style body being skipped
+
+    def feed(self, chunk):
+        return self._scan(self.carry + chunk)
+
+    def close(self):
+        hrefs = self._scan(self.carry, final=True)
+        self.carry = ''
+        self.skip_end = None
+        return hrefs
+
+    def _scan(self, text, final=False):
+        end = len(text)
+        if not final:
+            # Anything after the last '<' that has no closing '>' may be a tag split across chunks
+            cut = text.rfind('<')
+            if cut != -1 and text.find('>', cut) == -1 and len(text) - cut <= MAX_CARRY:
+                end = cut
+        hrefs = []
+        position = 0
+        while True:
+            if self.skip_end is not None:
+                match = self.skip_end.search(text, position, end)
+                if match is None:
+                    self.carry = '' if final else text[max(position, end - SKIP_CARRY):]
+                    return hrefs
+                position = match.end()
+                self.skip_end = None
+            match = TOKEN_RE.search(text, position, end)
+            if match is None:
+                break
+            position = match.end()
+            if match.group('comment'):
+                self.skip_end = SKIP_END_RES['comment']
+            elif match.group('raw'):
+                self.skip_end = SKIP_END_RES[match.group('raw').lower()]
+            else:
+                hrefs.append(match.group('double') or match.group('single') or match.group('bare') or '')
+        self.carry = text[end:]
+        return hrefs
+
+class _ParserTokenizer(HTMLParser):
+    """ Incremental html.parser that only collects a[href] values """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.hrefs = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'a':
+            for name, value in attrs:
+                if name == 'href' and value:
+                    self.hrefs.append(value)
+
+    def feed(self, chunk):
+        super().feed(chunk)
+        hrefs, self.hrefs = self.hrefs, []
+        return hrefs
+
+    def close(self):
+        super().close()
+        hrefs, self.hrefs = self.hrefs, []
+        return hrefs
+
+class _SoupTokenizer:
+    """ Original BeautifulSoup path; buffers the whole page and parses it on close """
+
+    def __init__(self):
+        from bs4 import BeautifulSoup
+        self.soup_class = BeautifulSoup
+        self.parts = []
+
+    def feed(self, chunk):
+        self.parts.append(chunk)
+        return []
+
+    def close(self):
+        soup = self.soup_class(''.join(self.parts), 'html.parser')
+        self.parts = []
+        return [a.get('href') for a in soup.find_all('a', href=True)]
+
+ENGINES = {
+    'regex': _RegexTokenizer,
+    'htmlparser': _ParserTokenizer,
+    'bs4': _SoupTokenizer,
+}
+
+class LinkStream:
+    """ Push-style extractor: feed it response bytes and get back absolute links found so far """
+
+    def __init__(self, base_url, engine=None, encoding='utf-8'):
+        self.base_url = base_url
+        self.tokenizer = ENGINES[engine or LINK_ENGINE]()
+        try:
+            self.decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+        except LookupError:
+            self.decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+    def _absolute(self, hrefs):
+        links = []
+        for href in hrefs:
+            link = absolute_link(self.base_url, href)
+            if link:
+                links.append(link)
+        return links
+
+    def feed(self, chunk):
+        text = self.decoder.decode(chunk)
+        if not text:
+            return []
+        return self._absolute(self.tokenizer.feed(text))
+
+    def close(self):
+        hrefs = []
+        tail = self.decoder.decode(b'', final=True)
+        if tail:
+            hrefs.extend(self.tokenizer.feed(tail))
+        hrefs.extend(self.tokenizer.close())
+        return self._absolute(hrefs)
+
+# Yield absolute links from a page as its byte chunks arrive
+def iter_links(byte_chunks, base_url, engine=None, encoding='utf-8'):
+    stream = LinkStream(base_url, engine, encoding)
+    for chunk in byte_chunks:
+        yield from stream.feed(chunk)
+    yield from stream.close()
+
+# Extract absolute links from a complete page
+def extract_links(page, base_url, engine=None, encoding='utf-8'):
+    if isinstance(page, str):
+        page = page.encode(encoding, errors='replace')
+    return list(iter_links([page], base_url, engine, encoding))
@@ -0,0 +1,280 @@
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Metrics configuration
+METRICS_HOST = '127.0.0.1'  # The endpoint is for local scraping only
+METRICS_DUMP_INTERVAL = 30  # Seconds between JSON dumps
+METRICS_PREFIX = 'roomba'
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Map an exception to a short cause label without importing every HTTP library
+def error_cause(exc):
+    names = {cls.__name__ for cls in type(exc).__mro__}
+    if names & {'TimeoutError', 'Timeout', 'ServerTimeoutError'}:
+        return 'timeout'
+    if names & {'SSLError', 'ClientSSLError', 'ClientConnectorCertificateError'}:
+        return 'ssl'
+    if names & {'gaierror', 'ClientConnectorDNSError'}:
+        return 'dns'
+    if names & {'TooManyRedirects'}:
+        return 'redirects'
+    if names & {'ConnectionError', 'ClientConnectionError', 'ClientOSError'}:
+        return 'connection'
+    if names & {'HTTPError', 'ClientResponseError', 'ClientPayloadError'}:
+        return 'http'
+    if names & {'PoolError'}:
+        return 'pool_exhausted'
+    if names & {'DatabaseError', 'InterfaceError'}:
+        return 'database'
+    return 'other'
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+def _format_labels(key, extra=None):
+    items = list(key) + ([extra] if extra else [])
+    if not items:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in items) + '}'
+
+class Histogram:
+    """ Fixed-bucket latency histogram """
+
+    __slots__ = ('counts', 'total', 'count', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+        if seconds > self.max:
+            self.max = seconds
+
+    # Upper bound of the bucket holding the given quantile
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return self.max
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'avg_ms': self.total / self.count * 1000 if self.count else 0.0,
+            'p50_ms': self.quantile(0.5) * 1000,
+            'p95_ms': self.quantile(0.95) * 1000,
+            'p99_ms': self.quantile(0.99) * 1000,
+            'max_ms': self.max * 1000,
+        }
+
+class _Timer:
+    __slots__ = ('metrics', 'name', 'labels', 'start')
+
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+class Metrics:
+    """ Process-wide counters, latency histograms and gauges; cheap enough to leave on """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}  # name -> {label key: value}
+        self.histograms = {}  # name -> {label key: Histogram}
+        self.gauges = {}  # name -> {label key: callable}
+        self.started = time.time()
+
+    def inc(self, name, amount=1, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name, seconds, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            series = self.histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram()
+            histogram.observe(seconds)
+
+    # Time a block: with metrics.timer('stage_seconds', stage='fetch'): ...
+    def timer(self, name, **labels):
+        return _Timer(self, name, labels)
+
+    # Register a callable that is sampled whenever metrics are read, e.g. a queue's qsize
+    def gauge(self, name, read, **labels):
+        with self.lock:
+            self.gauges.setdefault(name, {})[_label_key(labels)] = read
+
+    def remove_gauge(self, name, **labels):
+        with self.lock:
+            self.gauges.get(name, {}).pop(_label_key(labels), None)
+
+    def _read_gauges(self):
+        with self.lock:
+            gauges = {name: dict(series) for name, series in self.gauges.items()}
+        values = {}
+        for name, series in gauges.items():
+            for key, read in series.items():
+                try:
+                    values.setdefault(name, {})[key] = read()
+                except Exception:
+                    pass  # A gauge whose owner has gone away is simply skipped
+        return values
+
+    # Prometheus-style text exposition
+    def render_text(self):
+        gauges = self._read_gauges()
+        lines = [f"{METRICS_PREFIX}_uptime_seconds {time.time() - self.started:.1f}"]
+        with self.lock:
+            for name, series in sorted(self.counters.items()):
+                lines.append(f"# TYPE {METRICS_PREFIX}_{name} counter")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{METRICS_PREFIX}_{name}{_format_labels(key)} {value}")
+            for name, series in sorted(self.histograms.items()):
+                lines.append(f"# TYPE {METRICS_PREFIX}_{name} histogram")
+                for key, histogram in sorted(series.items()):
+                    cumulative = 0
+                    for bound, count in zip(LATENCY_BUCKETS, histogram.counts):
+                        cumulative += count
+                        lines.append(f"{METRICS_PREFIX}_{name}_bucket{_format_labels(key, ('le', bound))} {cumulative}")
+                    lines.append(f"{METRICS_PREFIX}_{name}_bucket{_format_labels(key, ('le', '+Inf'))} {histogram.count}")
+                    lines.append(f"{METRICS_PREFIX}_{name}_sum{_format_labels(key)} {histogram.total:.6f}")
+                    lines.append(f"{METRICS_PREFIX}_{name}_count{_format_labels(key)} {histogram.count}")
+        for name, series in sorted(gauges.items()):
+            lines.append(f"# TYPE {METRICS_PREFIX}_{name} gauge")
+            for key, value in sorted(series.items()):
+                lines.append(f"{METRICS_PREFIX}_{name}{_format_labels(key)} {value}")
+        return '\n'.join(lines) + '\n'
+
+    # Plain dict of everything, with label keys flattened to "a=x,b=y"
+    def snapshot(self):
+        def flat(key):
+            return ','.join(f"{name}={value}" for name, value in key) or 'all'
+
+        gauges = self._read_gauges()
+        with self.lock:
+            return {
+                'time': time.time(),
+                'uptime_seconds': time.time() - self.started,
+                'counters': {name: {flat(key): value for key, value in series.items()} for name, series in self.counters.items()},
+                'histograms': {name: {flat(key): h.snapshot() for key, h in series.items()} for name, series in self.histograms.items()},
+                'gauges': {name: {flat(key): value for key, value in series.items()} for name, series in gauges.items()},
+            }
+
+# Shared by every module in the process
+metrics = Metrics()
+
+# Time every pool checkout and count exhausted-pool errors
+def instrument_pool(pool, name):
+    get_connection = pool.get_connection
+
+    def timed_get_connection(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return get_connection(*args, **kwargs)
+        except Exception as e:
+            metrics.inc('errors_total', stage='pool', cause=error_cause(e))
+            raise
+        finally:
+            metrics.observe('pool_wait_seconds', time.perf_counter() - start, pool=name)
+
+    pool.get_connection = timed_get_connection
+    return pool
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.startswith('/metrics.json'):
+            body = json.dumps(metrics.snapshot(), indent=2).encode()
+            content_type = 'application/json'
+        elif self.path.startswith('/metrics') or self.path == '/':
+            body = metrics.render_text().encode()
+            content_type = 'text/plain; version=0.0.4'
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Keep scrapes out of the curses dashboards
+
+# Serve /metrics (text) and /metrics.json on a daemon thread; port 0 disables the endpoint
+def start_http_server(port, host=METRICS_HOST):
+    if not port:
+        return None
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        logging.error(f"Could not start metrics endpoint on {host}:{port}: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    return server
+
+# Per-second counter rates between two snapshots
+def _rates(previous, current):
+    elapsed = current['time'] - previous['time']
+    if elapsed <= 0:
+        return {}
+    return {
+        name: {key: (value - previous['counters'].get(name, {}).get(key, 0)) / elapsed for key, value in series.items()}
+        for name, series in current['counters'].items()
+    }
+
+def dump_json(path, previous=None):
+    snapshot = metrics.snapshot()
+    if previous is not None:
+        snapshot['rates_per_second'] = _rates(previous, snapshot)
+    temporary = f"{path}.tmp"
+    with open(temporary, 'w') as f:
+        json.dump(snapshot, f, indent=2)
+    os.replace(temporary, path)
+    return snapshot
+
+# Write the snapshot to path every interval seconds; a missing path disables the dump
+def start_json_dump(path, interval=METRICS_DUMP_INTERVAL):
+    if not path:
+        return None
+
+    def run():
+        previous = None
+        while True:
+            time.sleep(interval)
+            try:
+                previous = dump_json(path, previous)
+            except OSError as e:
+                logging.error(f"Could not write metrics to {path}: {e}")
+
+    thread = threading.Thread(target=run, name='metrics-dump', daemon=True)
+    thread.start()
+    return thread
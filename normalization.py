@@ -0,0 +1,62 @@
+import hashlib
+import re
+import unicodedata
+from public_suffix import domain_from_url, registrable_domain
+
+# Precompiled cleanup patterns, applied in this order by normalize_domain()
+_SCHEME_RE = re.compile(r'^https?://', re.IGNORECASE)
+_WWW_RE = re.compile(r'^www\.', re.IGNORECASE)
+_QUERY_FRAGMENT_RE = re.compile(r'[#?].*$')
+_NUMBERED_WWW_RE = re.compile(r'^www(\d+)\.', re.IGNORECASE)
+_PERCENT_RE = re.compile(r'%[0-9a-fA-F]{2}')
+_REPEATED_WWW_RE = re.compile(r'^wwwwww\.|wwwwww\.|^wwww\.')
+
+# Already a bare lowercase hostname, which is what the crawler produces almost every time
+_CLEAN_HOST_RE = re.compile(r'[a-z0-9-]+(?:\.[a-z0-9-]+)+')
+
+# Reduce a domain, hostname or URL to its canonical registrable domain
+def normalize_domain(domain):
+    if _CLEAN_HOST_RE.fullmatch(domain) and not domain.startswith('www'):
+        return registrable_domain(domain) or domain
+
+    domain = _SCHEME_RE.sub('', domain)
+    domain = _WWW_RE.sub('', domain)
+    domain = _QUERY_FRAGMENT_RE.sub('', domain)
+    domain = domain.rstrip('/')
+    domain = unicodedata.normalize('NFC', domain).lower().strip()
+    domain = _NUMBERED_WWW_RE.sub('', domain)
+    domain = _PERCENT_RE.sub(lambda match: chr(int(match.group(0)[1:], 16)), domain)
+    domain = _REPEATED_WWW_RE.sub('', domain)
+    return domain_from_url(domain) or domain
+
+# 16-byte digest of a normalized domain, stored in the unique domain_key column
+def domain_key(normalized):
+    return hashlib.blake2b(normalized.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+
+# Normalize a domain and return (canonical domain, domain_key)
+def canonical_domain(domain):
+    normalized = normalize_domain(domain)
+    return normalized, domain_key(normalized)
+
+# Add the domain_key column and its unique index if they are missing.
+# Rows written before the column existed keep a NULL key until clean_urls.py backfills them.
+def initialize_domain_keys(db):
+    cursor = db.cursor()
+    cursor.execute("""
+        SELECT COLUMN_NAME
+        FROM INFORMATION_SCHEMA.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'domains' AND COLUMN_NAME = 'domain_key'
+    """)
+    if cursor.fetchone() is None:
+        cursor.execute("ALTER TABLE domains ADD COLUMN domain_key BINARY(16) DEFAULT NULL")
+
+    cursor.execute("""
+        SELECT INDEX_NAME
+        FROM INFORMATION_SCHEMA.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'domains' AND INDEX_NAME = 'uniq_domain_key'
+    """)
+    if cursor.fetchone() is None:
+        cursor.execute("ALTER TABLE domains ADD UNIQUE INDEX uniq_domain_key (domain_key)")
+
+    db.commit()
+    cursor.close()
@@ -1,10 +1,19 @@
+import argparse
+import hashlib
 import requests
 import zipfile
 import io
+import os
+import tempfile
 import mysql.connector
 from bs4 import BeautifulSoup
 import logging
-import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urljoin
+from domain_stats import StatsCounters, initialize_stats
+from metrics import dump_json, error_cause, metrics, start_http_server
+from normalization import domain_key, initialize_domain_keys, normalize_domain
+from public_suffix import registrable_domain
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -15,15 +24,33 @@ DB_USER = 'root'
 DB_PASSWORD = '1234'
 DB_NAME = 'domain_scraper'
 
+# Archive source configuration
+NRD_INDEX_URL = 'https://www.whoisds.com/newly-registered-domains'  # Page listing the daily archives
+NRD_WORKERS = 4  # Archives downloaded and ingested at once
+LEDGER_MODE = 'skip'  # 'skip' archives already in the ledger, or 'revalidate' them with conditional GETs
+
+# Ingest configuration
+INGEST_METHOD = 'insert'  # 'insert' (multi-row INSERT IGNORE) or 'load_data' (LOAD DATA LOCAL INFILE; needs local_infile on the server)
+INGEST_BATCH_SIZE = 5000  # Domains per multi-row INSERT IGNORE
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024  # Bytes written to the temp file at a time
+
+# Metrics configuration
+METRICS_PORT = 9103  # Local /metrics endpoint while the lists download; 0 disables it
+METRICS_DUMP_PATH = 'metrics_nrd.json'  # Written after every list; None disables it
+
 # Connect to MySQL
-def connect_db():
+def connect_db(**options):
     return mysql.connector.connect(
         host=DB_HOST,
         user=DB_USER,
         password=DB_PASSWORD,
-        database=DB_NAME
+        database=DB_NAME,
+        **options
     )
 
+# Counter deltas for the dashboards, flushed after every saved list
+stats_counters = StatsCounters(connect_db)
+
 # Initialize the database and table
 def initialize_db():
     db = connect_db()
@@ -38,70 +65,296 @@ def initialize_db():
     """)
     db.commit()
     cursor.close()
+    initialize_domain_keys(db)
+    initialize_stats(db)
+    initialize_ledger(db)
     db.close()
 
-# Function to download and extract domain lists
-def download_and_extract(url):
-    try:
-        logging.info(f"Attempting to download: {url}")
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-
-        # Handle application/octet-stream content type as a ZIP file
-        with zipfile.ZipFile(io.BytesIO(response.content)) as z:
-            for file_info in z.infolist():
-                if file_info.filename.endswith('.txt'):
-                    with z.open(file_info) as f:
-                        domains = [line.strip() for line in f.read().decode('utf-8').splitlines()]
-                        return domains
-    except requests.HTTPError as e:
-        logging.error(f"Failed to download {url}: {e}")
-    except requests.Timeout:
-        logging.error(f"Timeout occurred for {url}")
-    except zipfile.BadZipFile:
-        logging.error(f"Invalid zip file from {url}")
-    return []
+# Create the ledger of archives that have been fetched and ingested
+def initialize_ledger(db):
+    cursor = db.cursor()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS nrd_archives (
+            url VARCHAR(512) PRIMARY KEY,
+            etag VARCHAR(255) DEFAULT NULL,
+            last_modified VARCHAR(64) DEFAULT NULL,
+            content_sha256 CHAR(64) DEFAULT NULL,
+            ingested INT DEFAULT 0,
+            new_domains INT DEFAULT 0,
+            duplicates INT DEFAULT 0,
+            skipped INT DEFAULT 0,
+            ingested_at DATETIME DEFAULT NULL,
+            checked_at DATETIME DEFAULT NULL
+        )
+    """)
+    # Ledgers created before lines without a registrable domain were counted
+    cursor.execute("""
+        SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'nrd_archives' AND COLUMN_NAME = 'skipped'
+    """)
+    if cursor.fetchone() is None:
+        cursor.execute("ALTER TABLE nrd_archives ADD COLUMN skipped INT DEFAULT 0 AFTER duplicates")
+    db.commit()
+    cursor.close()
 
-# Save domains to the database
-def save_domains(domains):
+# Ledger rows keyed by archive URL
+def load_ledger():
+    db = connect_db()
+    cursor = db.cursor(dictionary=True)
+    cursor.execute("SELECT url, etag, last_modified, content_sha256, ingested_at FROM nrd_archives")
+    ledger = {row['url']: row for row in cursor.fetchall()}
+    cursor.close()
+    db.close()
+    return ledger
+
+# Record a fetch; counts and ingested_at are only written when the archive was ingested
+def record_archive(url, download, result=None):
     db = connect_db()
     cursor = db.cursor()
-    newly_added = []
-    for domain in domains:
-        try:
-            cursor.execute("INSERT INTO domains (domain, crawled) VALUES (%s, 'no')", (domain,))
-            db.commit()
-            newly_added.append(domain)
-        except mysql.connector.errors.IntegrityError:
-            pass  # Ignore duplicates
+    if result is None:
+        cursor.execute("""
+            INSERT INTO nrd_archives (url, etag, last_modified, content_sha256, checked_at)
+            VALUES (%s, %s, %s, %s, NOW())
+            ON DUPLICATE KEY UPDATE etag = COALESCE(VALUES(etag), etag),
+                last_modified = COALESCE(VALUES(last_modified), last_modified),
+                content_sha256 = COALESCE(VALUES(content_sha256), content_sha256), checked_at = NOW()
+        """, (url, download.etag, download.last_modified, download.sha256))
+    else:
+        cursor.execute("""
+            INSERT INTO nrd_archives (url, etag, last_modified, content_sha256, ingested, new_domains, duplicates, skipped,
+                                      ingested_at, checked_at)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, NOW(), NOW())
+            ON DUPLICATE KEY UPDATE etag = VALUES(etag), last_modified = VALUES(last_modified),
+                content_sha256 = VALUES(content_sha256), ingested = VALUES(ingested), new_domains = VALUES(new_domains),
+                duplicates = VALUES(duplicates), skipped = VALUES(skipped), ingested_at = NOW(), checked_at = NOW()
+        """, (url, download.etag, download.last_modified, download.sha256, result.ingested, result.new, result.duplicates,
+              result.skipped))
+    db.commit()
     cursor.close()
     db.close()
-    return newly_added
 
-# Main function to scrape and download NRD lists
-def scrape_and_download_nrd_lists():
-    initialize_db()
-    url = 'https://www.whoisds.com/newly-registered-domains'
-    response = requests.get(url)
-    soup = BeautifulSoup(response.content, 'html.parser')
+class IngestResult:
+    """ Per-archive counts: lines read, rows inserted, domains that were already known and lines without a
+    registrable domain; ingested = new + duplicates + skipped """
+
+    def __init__(self):
+        self.ingested = 0
+        self.new = 0
+        self.duplicates = 0
+        self.skipped = 0
+
+    def __str__(self):
+        return f"ingested {self.ingested:,}, new {self.new:,}, duplicates {self.duplicates:,}, skipped {self.skipped:,}"
+
+class ArchiveDownload:
+    """ A downloaded archive (None when the server answered 304) and the validators to store in the ledger """
+
+    def __init__(self, archive, etag=None, last_modified=None, sha256=None):
+        self.archive = archive
+        self.etag = etag
+        self.last_modified = last_modified
+        self.sha256 = sha256
+
+    def close(self):
+        if self.archive is not None:
+            self.archive.close()
 
-    # Find all download links for NRD zip files
-    download_links = soup.find_all('a', href=True)
-    for link in download_links:
+# Stream an archive into a temp file instead of holding it in memory, hashing it on the way.
+# With a ledger entry the request is conditional on its ETag/Last-Modified.
+def download_archive(url, session=requests, entry=None):
+    logging.info(f"Attempting to download: {url}")
+    headers = {}
+    if entry is not None and entry.get('etag'):
+        headers['If-None-Match'] = entry['etag']
+    if entry is not None and entry.get('last_modified'):
+        headers['If-Modified-Since'] = entry['last_modified']
+
+    archive = tempfile.TemporaryFile()
+    digest = hashlib.sha256()
+    try:
+        with metrics.timer('stage_seconds', stage='download'):
+            with session.get(url, headers=headers, timeout=10, stream=True) as response:
+                if response.status_code == 304:
+                    archive.close()
+                    return ArchiveDownload(None, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+                response.raise_for_status()
+                for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    archive.write(chunk)
+                    digest.update(chunk)
+    except BaseException:
+        archive.close()
+        raise
+    archive.seek(0)
+    return ArchiveDownload(archive, response.headers.get('ETag'), response.headers.get('Last-Modified'), digest.hexdigest())
+
+# Yield canonical domains from every .txt member of an archive, one line at a time
+def iter_archive_domains(archive):
+    with zipfile.ZipFile(archive) as z:
+        for file_info in z.infolist():
+            if not file_info.filename.endswith('.txt'):
+                continue
+            with z.open(file_info) as f:
+                for line in io.TextIOWrapper(f, encoding='utf-8', errors='replace'):
+                    line = line.strip()
+                    if line:
+                        yield line
+
+# Normalize lines and drop repeats within the archive, counting every line read
+def _unique_domains(lines, result):
+    seen = set()
+    for line in lines:
+        result.ingested += 1
+        domain = normalize_domain(line)
+        if not registrable_domain(domain):
+            result.skipped += 1
+            continue
+        key = domain_key(domain)
+        if key in seen:
+            result.duplicates += 1
+            continue
+        seen.add(key)
+        yield domain, key
+
+# Multi-row INSERT IGNORE; the unique domain and domain_key indexes reject known domains
+def _insert_batches(db, domains, result):
+    cursor = db.cursor()
+    batch = []
+
+    def flush():
+        values = ', '.join(["(%s, %s, 'no')"] * len(batch))
+        cursor.execute(f"INSERT IGNORE INTO domains (domain, domain_key, crawled) VALUES {values}",
+                       [value for pair in batch for value in pair])
+        db.commit()
+        result.new += cursor.rowcount
+        result.duplicates += len(batch) - cursor.rowcount
+        batch.clear()
+
+    try:
+        for pair in domains:
+            batch.append(pair)
+            if len(batch) >= INGEST_BATCH_SIZE:
+                flush()
+        if batch:
+            flush()
+    finally:
+        cursor.close()
+
+# Write the archive's domains to a TSV and bulk-load it with LOAD DATA LOCAL INFILE
+def _load_data(db, domains, result):
+    with tempfile.NamedTemporaryFile('w', suffix='.tsv', encoding='utf-8', delete=False) as tsv:
+        count = 0
+        for domain, key in domains:
+            tsv.write(f"{domain}\t{key.hex()}\n")
+            count += 1
+    cursor = db.cursor()
+    try:
+        cursor.execute("""
+            LOAD DATA LOCAL INFILE %s IGNORE INTO TABLE domains
+            CHARACTER SET utf8mb4 FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n'
+            (domain, @domain_key) SET domain_key = UNHEX(@domain_key), crawled = 'no'
+        """, (tsv.name,))
+        db.commit()
+        result.new += cursor.rowcount
+        result.duplicates += count - cursor.rowcount
+    finally:
+        cursor.close()
+        os.unlink(tsv.name)
+
+# Stream an archive's domains into the table in bulk and return its counts
+def ingest_archive(archive, method=None):
+    method = method or INGEST_METHOD
+    result = IngestResult()
+    db = connect_db(allow_local_infile=True) if method == 'load_data' else connect_db()
+    try:
+        with metrics.timer('stage_seconds', stage='db_save'):
+            domains = _unique_domains(iter_archive_domains(archive), result)
+            if method == 'load_data':
+                _load_data(db, domains, result)
+            else:
+                _insert_batches(db, domains, result)
+    finally:
+        db.close()
+
+    metrics.inc('domains_ingested_total', result.ingested)
+    metrics.inc('domains_added_total', result.new)
+    metrics.inc('domains_skipped_total', result.skipped)
+    stats_counters.add('total', result.new)
+    stats_counters.add('uncrawled', result.new)
+    stats_counters.flush()
+    return result
+
+# Fetch one archive, ingesting it unless the ledger shows it has not changed; returns (outcome, IngestResult or None)
+def process_archive(url, entry=None, method=None):
+    if entry is not None and entry.get('ingested_at') and LEDGER_MODE == 'skip':
+        return 'skipped', None
+    session = requests.Session()
+    download = None
+    try:
+        download = download_archive(url, session, entry)
+        if download.archive is None:
+            record_archive(url, download)
+            return 'not_modified', None
+        if entry is not None and entry.get('ingested_at') and entry.get('content_sha256') == download.sha256:
+            record_archive(url, download)
+            return 'unchanged', None
+        result = ingest_archive(download.archive, method)
+        record_archive(url, download, result)
+        return 'ingested', result
+    except requests.RequestException as e:
+        metrics.inc('errors_total', stage='download', cause=error_cause(e))
+        logging.error(f"Failed to download {url}: {e}")
+    except zipfile.BadZipFile:
+        metrics.inc('errors_total', stage='download', cause='bad_zip')
+        logging.error(f"Invalid zip file from {url}")
+    except mysql.connector.Error as e:
+        metrics.inc('errors_total', stage='db_save', cause=error_cause(e))
+        logging.error(f"Database error while ingesting {url}: {e}")
+    finally:
+        if download is not None:
+            download.close()
+        session.close()
+    return 'failed', None
+
+# Archive links on the index page, resolved against the index URL
+def find_archive_urls(index_url, session=requests):
+    response = session.get(index_url, timeout=10)
+    response.raise_for_status()
+    soup = BeautifulSoup(response.content, 'html.parser')
+    urls = []
+    for link in soup.find_all('a', href=True):
         href = link['href']
         if '/whois-database/newly-registered-domains/' in href and href.endswith('/nrd'):
-            # Construct the full URL correctly
-            if href.startswith('http'):
-                full_url = href
-            else:
-                full_url = 'https://www.whoisds.com' + href
-            logging.info(f"Downloading {full_url}")
-            domains = download_and_extract(full_url)
-            if domains:
-                newly_added = save_domains(domains)
-                logging.info(f"Added {len(newly_added)} new domains from {full_url}")
-            # Add a delay to prevent server overload
-            time.sleep(1)
+            urls.append(urljoin(index_url, href))
+    return list(dict.fromkeys(urls))
+
+# Main function to scrape and download NRD lists
+def scrape_and_download_nrd_lists(index_url=None, workers=NRD_WORKERS):
+    initialize_db()
+    start_http_server(METRICS_PORT)
+    urls = find_archive_urls(index_url or NRD_INDEX_URL)
+    ledger = load_ledger()
+    logging.info(f"Found {len(urls)} archives, {sum(1 for url in urls if url in ledger)} already in the ledger")
+
+    # A bounded pool replaces the fixed sleep between sequential downloads
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(process_archive, url, ledger.get(url)): url for url in urls}
+        for future in as_completed(futures):
+            outcome, result = future.result()
+            logging.info(f"{futures[future]}: {outcome}" + (f" ({result})" if result is not None else ""))
+            metrics.inc('archives_total', outcome=outcome)
+            if METRICS_DUMP_PATH:
+                dump_json(METRICS_DUMP_PATH)
 
 if __name__ == "__main__":
-    scrape_and_download_nrd_lists()
+    parser = argparse.ArgumentParser(description="Download newly registered domain lists into the domains table")
+    parser.add_argument('--ingest-method', choices=['insert', 'load_data'], default=INGEST_METHOD,
+                        help="insert: multi-row INSERT IGNORE batches; load_data: LOAD DATA LOCAL INFILE")
+    parser.add_argument('--index-url', default=NRD_INDEX_URL, help="Page listing the archives, e.g. a local stand-in")
+    parser.add_argument('--workers', type=int, default=NRD_WORKERS, help="Archives fetched at once")
+    parser.add_argument('--revalidate', action='store_true',
+                        help="Re-request archives already in the ledger with conditional GETs instead of skipping them")
+    args = parser.parse_args()
+    INGEST_METHOD = args.ingest_method
+    if args.revalidate:
+        LEDGER_MODE = 'revalidate'
+    scrape_and_download_nrd_lists(args.index_url, args.workers)
@@ -0,0 +1,75 @@
+import asyncio
+import logging
+from metrics import error_cause, metrics
+
+# Pipeline configuration
+PIPELINE_WORKERS = 100  # Items being handled at once
+PREFETCH_PAGE_SIZE = 1000  # Rows fetched per keyset page
+WORK_QUEUE_SIZE = 2000  # Prefetched items waiting for a worker
+
+# Batch mode: fetch a chunk, handle all of it concurrently, repeat. One slow item holds up the whole chunk.
+async def run_batches(get_chunk, handle, concurrency=PIPELINE_WORKERS, after_chunk=None):
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+    handled = 0
+
+    async def limited(item):
+        async with semaphore:
+            await handle(item)
+
+    while True:
+        items = await loop.run_in_executor(None, get_chunk)
+        if not items:
+            break
+        await asyncio.gather(*(limited(item) for item in items))
+        handled += len(items)
+        if after_chunk is not None:
+            await after_chunk()
+    return handled
+
+# Stream mode: a keyset prefetcher feeds a bounded queue that a fixed worker pool drains continuously.
+# get_page(last_key, page_size) returns a list of (key, item) ordered by key. A politeness.PolitenessScheduler
+# passed as scheduler replaces the FIFO queue, so items come out in order of when their host may be visited.
+async def run_stream(get_page, handle, workers=PIPELINE_WORKERS, page_size=PREFETCH_PAGE_SIZE, queue_size=WORK_QUEUE_SIZE,
+                     scheduler=None):
+    loop = asyncio.get_running_loop()
+    work_queue = scheduler if scheduler is not None else asyncio.Queue(maxsize=queue_size)
+    handled = 0
+    metrics.gauge('queue_depth', work_queue.qsize, queue='work')
+
+    async def producer():
+        last_key = None
+        while True:
+            page = await loop.run_in_executor(None, get_page, last_key, page_size)
+            if not page:
+                break
+            last_key = page[-1][0]
+            items = [item for _, item in page]
+            if scheduler is not None:
+                await scheduler.prefetch(items)
+            for item in items:
+                await work_queue.put(item)
+
+    async def worker():
+        nonlocal handled
+        while True:
+            item = await work_queue.get()
+            try:
+                await handle(item)
+                handled += 1
+            except Exception as e:
+                metrics.inc('errors_total', stage='pipeline', cause=error_cause(e))
+                logging.error(f"Error handling {item}: {e}")
+            finally:
+                work_queue.task_done()
+
+    # Items can leave a scheduler out of order, so the workers stop once everything queued is handled, not at a sentinel
+    tasks = [asyncio.create_task(worker()) for _ in range(workers)]
+    try:
+        await producer()
+        await work_queue.join()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return handled
@@ -0,0 +1,340 @@
+import asyncio
+import collections
+import contextvars
+import heapq
+import itertools
+import random
+import time
+from metrics import metrics
+
+# Politeness configuration
+HOST_RATE = 0.5  # Visits per second to one domain once its burst is spent
+HOST_BURST = 2
+IP_RATE = 20.0  # Visits per second to one address; parking and shared hosting put thousands of domains on one IP
+IP_BURST = 40
+THROTTLE_STATUSES = {429, 503}  # Answers that mean "slow down"
+BACKOFF_BASE = 5  # Seconds of the first penalty after a throttle answer or a timeout; doubles with every strike
+BACKOFF_MAX = 300  # Longest penalty, also the cap on Retry-After
+BACKOFF_JITTER = 0.25  # Penalties are stretched by up to this fraction so penalized hosts do not all return at once
+BACKOFF_FORGET = 900  # Seconds after a penalty ends before its strikes are forgotten
+PRUNE_INTERVAL = 60  # Seconds between sweeps of idle buckets and expired penalties
+
+# The visit being handled by the current task; set by PolitenessScheduler.get(), read by the fetch path
+_current_visit = contextvars.ContextVar('politeness_visit', default=None)
+
+# Note the HTTP status of a response for the current visit; a no-op outside a scheduled visit
+def record_response(status, headers=None):
+    visit = _current_visit.get()
+    if visit is None:
+        return
+    if status in THROTTLE_STATUSES:
+        visit.throttled = True
+        retry_after = (headers or {}).get('Retry-After', '')
+        if retry_after.isdigit():  # The HTTP-date form is rare enough to ignore
+            visit.retry_after = max(visit.retry_after, int(retry_after))
+    else:
+        visit.answered = True
+
+# Note that a request of the current visit timed out
+def record_timeout():
+    visit = _current_visit.get()
+    if visit is not None:
+        visit.timed_out = True
+
+# locate callable backed by a dns_stage.DnsResolver; its cache makes the lookups repeated by the fetch itself free
+def dns_locator(resolver):
+    async def locate(host):
+        result = await resolver.resolve(host)
+        return min(result.addresses) if result.addresses else None
+    return locate
+
+class TokenBucket:
+    """ Token bucket in its GCRA form: each reservation gets the earliest time a token is free """
+
+    __slots__ = ('interval', 'tolerance', 'tat')
+
+    def __init__(self, rate, burst):
+        self.interval = 1.0 / rate
+        self.tolerance = (burst - 1) * self.interval
+        self.tat = 0.0  # Theoretical arrival time of the next request at the sustained rate
+
+    def earliest(self, after):
+        return max(after, self.tat - self.tolerance)
+
+    def reserve(self, at):
+        self.tat = max(self.tat, at) + self.interval
+
+    # A full bucket holds no state worth keeping
+    def is_full(self, now):
+        return self.tat <= now
+
+class Backoff:
+    """ Penalty of one host or address """
+
+    __slots__ = ('strikes', 'until', 'since')
+
+    def __init__(self):
+        self.strikes = 0
+        self.until = 0.0
+        self.since = 0.0
+
+class Visit:
+    """ One scheduled item and what its host answered """
+
+    __slots__ = ('item', 'host', 'address', 'queued_at', 'dispatched_at', 'answered', 'throttled', 'timed_out', 'retry_after')
+
+    def __init__(self, item, host, address, now):
+        self.item = item
+        self.host = host
+        self.address = address
+        self.queued_at = now
+        self.dispatched_at = now
+        self.answered = False  # Some request got a non-throttle answer
+        self.throttled = False  # Some request got 429/503
+        self.timed_out = False
+        self.retry_after = 0
+
+class PolitenessScheduler:
+    """ Bounded work queue that hands items out in order of when their host and IP may be visited next.
+
+    A drop-in for the asyncio.Queue feeding a worker pool: put(), get(), task_done(), join(). Items whose host or
+    address is rate limited or penalized wait in a heap keyed by their eligible time instead of holding a worker,
+    so the workers stay busy on hosts that are ready. A worker's fetch path reports what the host answered with
+    record_response()/record_timeout(); task_done() turns 429/503 and timeouts into exponential backoff.
+    """
+
+    def __init__(self, maxsize=0, host_of=None, locate=None, enabled=True, host_rate=HOST_RATE, host_burst=HOST_BURST,
+                 ip_rate=IP_RATE, ip_burst=IP_BURST):
+        self.maxsize = maxsize
+        self.host_of = host_of or (lambda item: item)  # Item -> host name; None for items that need no network, e.g. cache hits
+        self.locate = locate if enabled else None  # Optional async host -> address, e.g. dns_locator()
+        self.enabled = enabled  # False makes this a plain FIFO queue
+        self.host_rate = host_rate
+        self.host_burst = host_burst
+        self.ip_rate = ip_rate
+        self.ip_burst = ip_burst
+        self.heap = []  # (eligible time, sequence, Visit)
+        self.sequence = itertools.count()
+        self.host_buckets = {}
+        self.ip_buckets = {}
+        self.backoffs = {}  # ('host' | 'ip', name) -> Backoff
+        self.getters = collections.deque()
+        self.putters = collections.deque()
+        self.timer = None
+        self.timer_at = 0.0
+        self.unfinished = 0
+        self.finished = asyncio.Event()
+        self.finished.set()
+        self.pruned_at = time.monotonic()
+
+    def qsize(self):
+        return len(self.heap)
+
+    def empty(self):
+        return not self.heap
+
+    # Hosts and addresses currently penalized
+    def penalized(self):
+        now = time.monotonic()
+        return sum(1 for backoff in self.backoffs.values() if backoff.until > now)
+
+    # Resolve the hosts of upcoming items concurrently so put() does not wait for them one at a time
+    async def prefetch(self, items):
+        if self.locate is not None:
+            hosts = [self.host_of(item) for item in items]
+            await asyncio.gather(*(self.locate(host) for host in hosts if host is not None))
+
+    async def put(self, item):
+        host = self.host_of(item)
+        address = await self.locate(host) if self.locate is not None and host is not None else None
+        while self.maxsize and len(self.heap) >= self.maxsize:
+            putter = asyncio.get_running_loop().create_future()
+            self.putters.append(putter)
+            try:
+                await putter
+            except asyncio.CancelledError:
+                putter.cancel()
+                try:
+                    self.putters.remove(putter)
+                except ValueError:
+                    pass
+                if len(self.heap) < self.maxsize and not putter.cancelled():
+                    self._wake(self.putters)
+                raise
+
+        now = time.monotonic()
+        visit = Visit(item, host, address, now)
+        eligible = self._reserve(visit, now)
+        heapq.heappush(self.heap, (eligible, next(self.sequence), visit))
+        self.unfinished += 1
+        self.finished.clear()
+        if eligible <= now:
+            self._wake(self.getters)
+        else:
+            self._arm_timer()
+
+    # Wait for the next item whose host and address may be visited now
+    async def get(self):
+        while True:
+            now = time.monotonic()
+            visit = self._pop_ready(now)
+            if visit is not None:
+                break
+            getter = asyncio.get_running_loop().create_future()
+            self.getters.append(getter)
+            self._arm_timer()
+            try:
+                await getter
+            except asyncio.CancelledError:
+                getter.cancel()
+                try:
+                    self.getters.remove(getter)
+                except ValueError:
+                    pass
+                if not getter.cancelled():
+                    # Woken and cancelled at once; hand the wakeup on
+                    self._wake(self.getters)
+                raise
+
+        visit.dispatched_at = now
+        metrics.observe('stage_seconds', now - visit.queued_at, stage='schedule')
+        _current_visit.set(visit)
+        self._wake(self.putters)
+        if self.heap and self.heap[0][0] <= now:
+            self._wake(self.getters)
+        else:
+            self._arm_timer()
+        return visit.item
+
+    # Mark the current task's item as handled and apply what its host answered
+    def task_done(self):
+        visit = _current_visit.get()
+        if visit is not None:
+            _current_visit.set(None)
+            self._settle(visit, time.monotonic())
+        if self.unfinished <= 0:
+            raise ValueError('task_done() called too many times')
+        self.unfinished -= 1
+        if self.unfinished == 0:
+            self.finished.set()
+
+    async def join(self):
+        if self.unfinished:
+            await self.finished.wait()
+
+    # Remove and return every waiting item regardless of politeness, e.g. to hand leases back on shutdown
+    def drain(self):
+        items = [visit.item for _, _, visit in sorted(self.heap)]
+        self.heap.clear()
+        self.unfinished -= len(items)
+        if self.unfinished == 0:
+            self.finished.set()
+        while self.putters:
+            self._wake(self.putters)
+        return items
+
+    def _pop_ready(self, now):
+        if now - self.pruned_at > PRUNE_INTERVAL:
+            self._prune(now)
+        while self.heap and self.heap[0][0] <= now:
+            _, _, visit = heapq.heappop(self.heap)
+            # Penalized since it was queued: book a new slot after the penalty
+            if self._penalty_until(visit) > now:
+                heapq.heappush(self.heap, (self._reserve(visit, now), next(self.sequence), visit))
+                metrics.inc('politeness_deferred_total')
+                continue
+            return visit
+        return None
+
+    # Book the earliest slot both the host and the address buckets allow, at or after any penalty
+    def _reserve(self, visit, now):
+        if not self.enabled or visit.host is None:
+            return now
+        after = max(now, self._penalty_until(visit))
+        buckets = [self._bucket(self.host_buckets, visit.host, self.host_rate, self.host_burst)]
+        if visit.address is not None:
+            buckets.append(self._bucket(self.ip_buckets, visit.address, self.ip_rate, self.ip_burst))
+        eligible = max(bucket.earliest(after) for bucket in buckets)
+        for bucket in buckets:
+            bucket.reserve(eligible)
+        return eligible
+
+    def _bucket(self, buckets, key, rate, burst):
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = TokenBucket(rate, burst)
+        return bucket
+
+    def _keys(self, visit):
+        if visit.host is None:
+            return []
+        keys = [('host', visit.host)]
+        if visit.address is not None:
+            keys.append(('ip', visit.address))
+        return keys
+
+    def _penalty_until(self, visit):
+        until = 0.0
+        for key in self._keys(visit):
+            backoff = self.backoffs.get(key)
+            if backoff is not None:
+                until = max(until, backoff.until)
+        return until
+
+    def _settle(self, visit, now):
+        if not self.enabled:
+            return
+        if visit.throttled or (visit.timed_out and not visit.answered):
+            for key in self._keys(visit):
+                self._back_off(key, visit, now)
+        elif visit.answered:
+            for key in self._keys(visit):
+                self.backoffs.pop(key, None)
+
+    def _back_off(self, key, visit, now):
+        backoff = self.backoffs.get(key)
+        if backoff is None:
+            backoff = self.backoffs[key] = Backoff()
+        # Visits already in flight when the current penalty started do not add strikes of their own
+        if visit.dispatched_at < backoff.since and backoff.until > now:
+            return
+        backoff.strikes += 1
+        delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (backoff.strikes - 1))
+        if visit.retry_after:
+            delay = max(delay, min(visit.retry_after, BACKOFF_MAX))
+        delay *= 1 + random.uniform(0, BACKOFF_JITTER)
+        backoff.since = now
+        backoff.until = max(backoff.until, now + delay)
+        metrics.inc('politeness_backoffs_total', scope=key[0])
+
+    # Drop full buckets and long-expired penalties so the maps do not grow with every host ever seen
+    def _prune(self, now):
+        self.pruned_at = now
+        for buckets in (self.host_buckets, self.ip_buckets):
+            for key in [key for key, bucket in buckets.items() if bucket.is_full(now)]:
+                del buckets[key]
+        for key in [key for key, backoff in self.backoffs.items() if backoff.until + BACKOFF_FORGET < now]:
+            del self.backoffs[key]
+
+    def _wake(self, waiters):
+        while waiters:
+            waiter = waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+
+    # Wake one getter when the earliest waiting item becomes eligible
+    def _arm_timer(self):
+        if not self.heap or not self.getters:
+            return
+        eligible = self.heap[0][0]
+        if self.timer is not None:
+            if self.timer_at <= eligible:
+                return
+            self.timer.cancel()
+        self.timer_at = eligible
+        self.timer = asyncio.get_running_loop().call_later(max(0.0, eligible - time.monotonic()), self._on_timer)
+
+    def _on_timer(self):
+        self.timer = None
+        self._wake(self.getters)
@@ -0,0 +1,249 @@
+import argparse
+import logging
+import time
+import mysql.connector
+
+# Database configuration
+DB_HOST = 'localhost'
+DB_USER = 'root'
+DB_PASSWORD = '1234'
+DB_NAME = 'domain_scraper'
+
+# One bit per probed URL variant; status_flags is NULL until a domain has been checked and 0 when nothing answered
+VARIANT_BITS = {'https': 1, 'httpswww': 2, 'http': 4, 'httpwww': 8}
+
+# Backfill configuration
+BACKFILL_CHUNK_SIZE = 2000  # Primary-key range converted per transaction
+BACKFILL_MAX_ROWS_PER_SEC = 20000  # Id range scanned per second; 0 disables throttling
+
+def status_flags(reachability):
+    flags = 0
+    for variant, reachable in reachability.items():
+        if reachable:
+            flags |= VARIANT_BITS[variant]
+    return flags
+
+def reachable_variants(flags):
+    return [variant for variant, bit in VARIANT_BITS.items() if flags and flags & bit]
+
+# Wappalyzer's {name: {'versions': [...]}} as [(name, version)]
+def technology_list(technologies):
+    if not technologies:
+        return []
+    return [(name, ' '.join(details.get('versions') or [])[:64]) for name, details in technologies.items()]
+
+# Legacy domain_status text ("https, httpwww") to status_flags
+def parse_status_text(text):
+    return status_flags({variant.strip(): True for variant in text.split(',') if variant.strip() in VARIANT_BITS})
+
+# Legacy cms text ("WordPress 6.1, PHP, Nginx 1.18") to [(name, version)]; trailing version-looking words are the version
+def parse_cms_text(text):
+    if not text or text == 'N/A':
+        return []
+    technologies = []
+    for entry in text.split(', '):
+        words = entry.split(' ')
+        split = len(words)
+        while split > 1 and words[split - 1][:1].isdigit():
+            split -= 1
+        name = ' '.join(words[:split]).strip()
+        if name:
+            technologies.append((name[:128], ' '.join(words[split:])[:64]))
+    return technologies
+
+def _column_exists(cursor, column):
+    cursor.execute("""
+        SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'domains' AND COLUMN_NAME = %s
+    """, (column,))
+    return cursor.fetchone() is not None
+
+def _index_exists(cursor, table, index):
+    cursor.execute("""
+        SELECT INDEX_NAME FROM INFORMATION_SCHEMA.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s
+    """, (table, index))
+    return cursor.fetchone() is not None
+
+# Add the typed probe columns, their indexes and the technology tables if they are missing
+def initialize_probe_schema(db):
+    cursor = db.cursor()
+    columns = {
+        'status_flags': "TINYINT UNSIGNED DEFAULT NULL",
+        'checked_at': "DATETIME DEFAULT NULL",
+    }
+    for column, definition in columns.items():
+        if not _column_exists(cursor, column):
+            cursor.execute(f"ALTER TABLE domains ADD COLUMN {column} {definition}")
+
+    # Work selection is "status_flags IS NULL AND id > ? ORDER BY id"; resets filter on checked_at
+    if not _index_exists(cursor, 'domains', 'idx_unchecked'):
+        cursor.execute("ALTER TABLE domains ADD INDEX idx_unchecked (status_flags, id)")
+    if not _index_exists(cursor, 'domains', 'idx_checked_at'):
+        cursor.execute("ALTER TABLE domains ADD INDEX idx_checked_at (checked_at)")
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS technologies (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            name VARCHAR(128) NOT NULL UNIQUE
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS domain_technologies (
+            domain_id INT NOT NULL,
+            tech_id INT NOT NULL,
+            version VARCHAR(64) NOT NULL DEFAULT '',
+            PRIMARY KEY (domain_id, tech_id),
+            INDEX idx_tech (tech_id, domain_id)
+        )
+    """)
+    db.commit()
+    cursor.close()
+
+# True while the old domain_status/cms text columns are still present
+def has_legacy_columns(db):
+    cursor = db.cursor()
+    legacy = _column_exists(cursor, 'domain_status')
+    cursor.close()
+    return legacy
+
+# SQL condition for "not checked yet"; rows with legacy text that the backfill has not reached count as checked
+def unchecked_condition(legacy):
+    return "status_flags IS NULL AND domain_status IS NULL" if legacy else "status_flags IS NULL"
+
+def checked_condition(legacy):
+    return "(status_flags IS NOT NULL OR domain_status IS NOT NULL)" if legacy else "status_flags IS NOT NULL"
+
+class TechnologyIds:
+    """ Process-wide cache of technology name -> id, holding only ids from committed transactions """
+
+    def __init__(self):
+        self.ids = {}
+
+    # Ids of names, inserting unknown ones within the caller's transaction; pass the result to remember() once it commits
+    def lookup(self, cursor, names):
+        names = set(names)
+        ids = {name: self.ids[name] for name in names if name in self.ids}
+        missing = sorted(names - ids.keys())
+        if missing:
+            cursor.executemany("INSERT IGNORE INTO technologies (name) VALUES (%s)", [(name,) for name in missing])
+            placeholders = ', '.join(['%s'] * len(missing))
+            cursor.execute(f"SELECT name, id FROM technologies WHERE name IN ({placeholders})", missing)
+            ids.update(cursor.fetchall())
+        return ids
+
+    # A rolled back insert leaves no row, so ids only enter the cache after their transaction commits
+    def remember(self, ids):
+        self.ids.update(ids)
+
+technology_ids = TechnologyIds()
+
+# Replace the technologies of each domain; pairs are (domain_id, [(name, version)]).
+# Returns the technology ids used, for technology_ids.remember() after the commit.
+def replace_domain_technologies(cursor, pairs):
+    if not pairs:
+        return {}
+    domain_ids = [domain_id for domain_id, _ in pairs]
+    placeholders = ', '.join(['%s'] * len(domain_ids))
+    cursor.execute(f"DELETE FROM domain_technologies WHERE domain_id IN ({placeholders})", domain_ids)
+    ids = technology_ids.lookup(cursor, [name for _, technologies in pairs for name, _ in technologies])
+    rows = {(domain_id, ids[name]): version for domain_id, technologies in pairs for name, version in technologies}
+    if rows:
+        cursor.executemany(
+            "INSERT INTO domain_technologies (domain_id, tech_id, version) VALUES (%s, %s, %s)",
+            [(domain_id, tech_id, version) for (domain_id, tech_id), version in rows.items()]
+        )
+    return ids
+
+def connect_db():
+    return mysql.connector.connect(host=DB_HOST, user=DB_USER, password=DB_PASSWORD, database=DB_NAME)
+
+# Convert legacy text rows to status_flags and domain_technologies in small id ranges, alongside running checkers
+def backfill(chunk_size=BACKFILL_CHUNK_SIZE, max_rows_per_sec=BACKFILL_MAX_ROWS_PER_SEC):
+    db = connect_db()
+    initialize_probe_schema(db)
+    if not has_legacy_columns(db):
+        logging.info("No legacy domain_status/cms columns; nothing to backfill.")
+        db.close()
+        return 0
+
+    cursor = db.cursor()
+    cursor.execute("SELECT COALESCE(MIN(id), 0), COALESCE(MAX(id), 0) FROM domains")
+    start_id, max_id = cursor.fetchone()
+    first_id = start_id
+    started = time.monotonic()
+    converted = 0
+    while start_id <= max_id:
+        chunk_started = time.monotonic()
+        end_id = start_id + chunk_size
+        try:
+            # Rows the checker has rewritten since have status_flags set and are left alone
+            cursor.execute("""
+                SELECT id, domain_status, cms FROM domains
+                WHERE id >= %s AND id < %s AND status_flags IS NULL AND domain_status IS NOT NULL
+                FOR UPDATE
+            """, (start_id, end_id))
+            rows = cursor.fetchall()
+            tech_ids = {}
+            if rows:
+                cases = ' '.join(['WHEN %s THEN %s'] * len(rows))
+                placeholders = ', '.join(['%s'] * len(rows))
+                parameters = [value for domain_id, status, _ in rows for value in (domain_id, parse_status_text(status))]
+                cursor.execute(
+                    f"UPDATE domains SET status_flags = CASE id {cases} END WHERE id IN ({placeholders})",
+                    parameters + [domain_id for domain_id, _, _ in rows]
+                )
+                tech_ids = replace_domain_technologies(cursor, [(domain_id, parse_cms_text(cms)) for domain_id, _, cms in rows if parse_cms_text(cms)])
+            db.commit()
+            technology_ids.remember(tech_ids)
+        except mysql.connector.Error:
+            db.rollback()
+            raise
+        converted += len(rows)
+        start_id = end_id
+
+        done = min(start_id, max_id + 1) - first_id
+        if done % (chunk_size * 50) == 0 or start_id > max_id:
+            elapsed = time.monotonic() - started
+            rate = done / elapsed if elapsed else 0.0
+            eta = (max_id + 1 - min(start_id, max_id + 1)) / rate if rate else 0.0
+            logging.info(f"Backfilled up to id {start_id - 1:,} of {max_id:,}: {converted:,} rows, ETA {eta / 60:.1f} min")
+
+        if max_rows_per_sec:
+            minimum = chunk_size / max_rows_per_sec
+            elapsed = time.monotonic() - chunk_started
+            if elapsed < minimum:
+                time.sleep(minimum - elapsed)
+
+    cursor.close()
+    db.close()
+    logging.info(f"Backfill converted {converted:,} rows.")
+    return converted
+
+# Drop the text columns once every legacy row has been converted
+def drop_legacy_columns():
+    db = connect_db()
+    cursor = db.cursor()
+    if not has_legacy_columns(db):
+        logging.info("Legacy columns are already gone.")
+    else:
+        cursor.execute("SELECT COUNT(*) FROM domains WHERE status_flags IS NULL AND domain_status IS NOT NULL")
+        remaining = cursor.fetchone()[0]
+        if remaining:
+            logging.error(f"{remaining:,} rows still need the backfill; not dropping domain_status/cms.")
+        else:
+            cursor.execute("ALTER TABLE domains DROP COLUMN domain_status, DROP COLUMN cms")
+            logging.info("Dropped domain_status and cms.")
+    cursor.close()
+    db.close()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Migrate probe results to status_flags and domain_technologies")
+    parser.add_argument('--chunk-size', type=int, default=BACKFILL_CHUNK_SIZE)
+    parser.add_argument('--max-rows-per-sec', type=int, default=BACKFILL_MAX_ROWS_PER_SEC, help="Throttle; 0 disables it")
+    parser.add_argument('--drop-legacy', action='store_true', help="Drop domain_status/cms after a complete backfill")
+    args = parser.parse_args()
+    backfill(args.chunk_size, args.max_rows_per_sec)
+    if args.drop_legacy:
+        drop_legacy_columns()
@@ -0,0 +1,232 @@
+import asyncio
+import threading
+import time
+import aiohttp
+from metrics import error_cause, metrics
+from politeness import record_response, record_timeout
+
+# Probe configuration
+PROBE_MODE = 'all'  # 'all', 'sequential', 'first' or 'staggered'; see probe_domain() for what each one records
+PROBE_TIMEOUT = 5  # Seconds per URL variant
+PROBE_STAGGER = 0.25  # Seconds before the next variant starts in 'staggered' mode
+PROBE_COLLAPSE_WAIT = 1.0  # Seconds the www variants wait for the bare pair's redirect chains in 'all' mode
+MAX_BODY_BYTES = 2 * 1024 * 1024  # Page bytes kept for technology analysis
+VARIANT_ORDER = ['https', 'httpswww', 'http', 'httpwww']
+
+# Headers to mimic a browser request
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/92.0.4515.107 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Accept-Encoding': 'gzip, deflate, br',
+    'Connection': 'keep-alive',
+}
+
+def url_variations(domain):
+    return {
+        "https": f"https://{domain}",
+        "httpswww": f"https://www.{domain}",
+        "http": f"http://{domain}",
+        "httpwww": f"http://www.{domain}",
+    }
+
+# Strip the trailing slash so "https://x.com" and "https://x.com/" compare equal
+def _url_key(url):
+    return url.rstrip('/')
+
+class ProbeResult:
+    """ Outcome of probing the URL variants of one domain """
+
+    def __init__(self, domain):
+        self.domain = domain
+        self.reachability = {key: False for key in VARIANT_ORDER}
+        self.final_urls = {}
+        self.page = None  # (url, html, headers) of the first reachable variant
+        self.probes = 0  # HTTP requests actually issued
+        self.collapsed = 0  # Variants answered by another variant's redirect chain
+        self.latency = 0.0
+
+    def is_reachable_any(self):
+        return any(self.reachability.values())
+
+class ProbeStats:
+    """ Thread-safe per-domain probe count and latency counters """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.domains = 0
+        self.probes = 0
+        self.collapsed = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def record(self, result):
+        with self.lock:
+            self.domains += 1
+            self.probes += result.probes
+            self.collapsed += result.collapsed
+            self.total_latency += result.latency
+            self.max_latency = max(self.max_latency, result.latency)
+
+    def snapshot(self):
+        with self.lock:
+            domains = self.domains or 1
+            return {
+                'domains': self.domains,
+                'probes_per_domain': self.probes / domains,
+                'collapsed': self.collapsed,
+                'avg_ms': self.total_latency / domains * 1000,
+                'max_ms': self.max_latency * 1000,
+            }
+
+# Shared by every prober in the process so the dashboard can show probe cost
+probe_stats = ProbeStats()
+
+class PageClaim:
+    """ Lets one variant of a domain at a time read the page body; a failed read hands the claim back """
+
+    def __init__(self):
+        self.claimed = False
+        self.failed = set()  # URLs whose body could not be read
+
+    def claim(self):
+        if self.claimed:
+            return False
+        self.claimed = True
+        return True
+
+    def release(self, url):
+        self.claimed = False
+        self.failed.add(url)
+
+# Fetch a URL, returning (reachable, page, redirect chain); the body is only read when page_claim allows it
+async def fetch_page(session, url, page_claim=None, timeout=PROBE_TIMEOUT):
+    try:
+        async with session.get(url, timeout=aiohttp.ClientTimeout(total=timeout), headers=HEADERS) as response:
+            chain = [str(r.url) for r in response.history] + [str(response.url)]
+            metrics.inc('http_responses_total', status=f"{response.status // 100}xx")
+            record_response(response.status, response.headers)
+            if response.status != 200:
+                return False, None, chain
+            if page_claim is None or not page_claim.claim():
+                return True, None, chain
+            try:
+                body = await response.content.read(MAX_BODY_BYTES)
+            except Exception as e:
+                # Reachable all the same; let another variant provide the page
+                page_claim.release(url)
+                if isinstance(e, asyncio.TimeoutError):
+                    record_timeout()
+                metrics.inc('errors_total', stage='probe_body', cause=error_cause(e))
+                return True, None, chain
+            html = body.decode(response.charset or 'utf-8', errors='replace')
+            return True, (str(response.url), html, dict(response.headers)), chain
+    except Exception as e:
+        if isinstance(e, asyncio.TimeoutError):
+            record_timeout()
+        metrics.inc('errors_total', stage='probe', cause=error_cause(e))
+        return False, None, []
+
+# Probe the URL variants of a domain.
+#  all:        the bare https/http pair concurrently, then, once both answered or after PROBE_COLLAPSE_WAIT
+#              seconds, the www variants their redirects did not already cover; waits for all of them (the default)
+#  sequential: one variant after another, all of them (the original behaviour)
+#  first:      every variant concurrently, stopping at the first reachable one
+#  staggered:  happy-eyeballs; start the next variant after PROBE_STAGGER seconds or as soon as one fails,
+#              stopping at the first reachable one
+# 'all' and 'sequential' report the reachability of every variant, as status_flags always has. In 'first' and
+# 'staggered' mode only the winning variant is reported reachable, so status_flags then means "first reachable
+# variant" and the other variants' bits stay clear.
+# A variant whose URL is a hop in an earlier variant's redirect chain is not requested; it gets that chain's outcome
+# and counts as collapsed. Only 'all' and 'sequential' can collapse, since the other modes start variants before
+# any chain is known.
+async def probe_domain(session, domain, mode=None, stagger=PROBE_STAGGER, timeout=PROBE_TIMEOUT):
+    mode = mode or PROBE_MODE
+    start = time.perf_counter()
+    result = ProbeResult(domain)
+    urls = url_variations(domain)
+    chains = {}  # URL key -> reachability of every URL seen in a redirect chain
+    page_claim = PageClaim()
+
+    async def probe(key):
+        known = chains.get(_url_key(urls[key]))
+        if known is not None:
+            # Another variant already redirected through this URL
+            result.collapsed += 1
+            return key, known, None, []
+        result.probes += 1
+        return (key, *await fetch_page(session, urls[key], page_claim, timeout))
+
+    def record(outcome):
+        key, reachable, page, chain = outcome
+        result.reachability[key] = reachable
+        if page and result.page is None:
+            result.page = page
+        if chain:
+            result.final_urls[key] = chain[-1]
+            for url in chain:
+                chains[_url_key(url)] = reachable
+        return reachable
+
+    if mode == 'sequential':
+        for key in VARIANT_ORDER:
+            record(await probe(key))
+    elif mode == 'all':
+        # The www variants usually redirect to the bare host or the other way round, so learn the bare chains first,
+        # but not for so long that a silent bare host doubles the probe time
+        bare = [asyncio.create_task(probe(key)) for key in ('https', 'http')]
+        try:
+            done, _ = await asyncio.wait(bare, timeout=PROBE_COLLAPSE_WAIT)
+            for task in bare:
+                if task in done:
+                    record(task.result())
+            www = [asyncio.create_task(probe(key)) for key in ('httpswww', 'httpwww')]
+            for outcome in await asyncio.gather(*[task for task in bare if task not in done], *www):
+                record(outcome)
+        finally:
+            for task in bare:
+                task.cancel()
+    else:
+        waiting = list(VARIANT_ORDER)
+        pending = set()
+        if mode == 'first':
+            pending = {asyncio.create_task(probe(key)) for key in waiting}
+            waiting = []
+        found = False
+
+        # Keep starting variants until one is reachable, or until one can provide the page after a failed read
+        def searching():
+            return not found or (result.page is None and not page_claim.claimed and bool(page_claim.failed))
+
+        # Done once a variant is reachable and the page is read, or nobody is reading it and no read failed
+        def settled():
+            return found and (result.page is not None or not (page_claim.claimed or page_claim.failed))
+
+        try:
+            while (waiting or pending) and not settled():
+                if waiting and searching():
+                    pending.add(asyncio.create_task(probe(waiting.pop(0))))
+                wait_for = stagger if waiting and searching() else None
+                if not pending:
+                    break
+                done, pending = await asyncio.wait(pending, timeout=wait_for, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if record(task.result()):
+                        found = True
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+    # The page read failed, or lost the claim to a read that failed: fetch it from another reachable variant
+    if result.page is None and page_claim.failed:
+        for key in VARIANT_ORDER:
+            if result.reachability[key] and urls[key] not in page_claim.failed:
+                result.probes += 1
+                _, result.page, _ = await fetch_page(session, urls[key], page_claim, timeout)
+                if result.page is not None:
+                    break
+
+    result.latency = time.perf_counter() - start
+    return result
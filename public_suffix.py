@@ -0,0 +1,140 @@
+import logging
+import os
+import pickle
+import threading
+from functools import lru_cache
+
+# Public Suffix List configuration
+PSL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'public_suffix_list.dat')  # Bundled snapshot (2023-02-09)
+PSL_TRIE_CACHE = PSL_PATH + '.trie'  # Compiled trie, rebuilt when the snapshot changes
+INCLUDE_PRIVATE_SUFFIXES = False  # Treat private suffixes (github.io, blogspot.com) as public suffixes
+TRIE_VERSION = 1
+
+# Trie node markers
+RULE = '$'  # A rule ends at this node
+EXCEPTION = '!'  # An exception rule ends at this node
+WILDCARD = '*'
+
+_trie = None
+_trie_lock = threading.Lock()
+
+# Convert a label to its ASCII (punycode) form, leaving it unchanged if that fails
+def _to_ascii(label):
+    try:
+        return label.encode('idna').decode('ascii')
+    except UnicodeError:
+        return label
+
+# Parse the PSL file into a reversed-label trie of nested dicts
+def compile_trie(path=PSL_PATH, include_private=INCLUDE_PRIVATE_SUFFIXES):
+    trie = {}
+    private = False
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith('// ===BEGIN PRIVATE DOMAINS==='):
+                private = True
+            if not line or line.startswith('//'):
+                continue
+            if private and not include_private:
+                continue
+
+            rule = line.split()[0].lower()
+            marker = RULE
+            if rule.startswith('!'):
+                rule = rule[1:]
+                marker = EXCEPTION
+
+            for labels in {tuple(rule.split('.')), tuple(_to_ascii(label) for label in rule.split('.'))}:
+                node = trie
+                for label in reversed(labels):
+                    node = node.setdefault(label, {})
+                node[marker] = True
+    return trie
+
+# Load the compiled trie from its cache, compiling and caching it on first use
+def load_trie(path=PSL_PATH, cache_path=PSL_TRIE_CACHE):
+    global _trie
+    if _trie is not None:
+        return _trie
+    with _trie_lock:
+        if _trie is not None:
+            return _trie
+        key = (TRIE_VERSION, os.path.getmtime(path), os.path.getsize(path), INCLUDE_PRIVATE_SUFFIXES)
+        try:
+            with open(cache_path, 'rb') as f:
+                cached_key, trie = pickle.load(f)
+            if cached_key != key:
+                trie = None
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+            trie = None
+
+        if trie is None:
+            trie = compile_trie(path)
+            try:
+                with open(cache_path, 'wb') as f:
+                    pickle.dump((key, trie), f, protocol=pickle.HIGHEST_PROTOCOL)
+            except OSError as e:
+                logging.warning(f"Could not cache compiled suffix trie at {cache_path}: {e}")
+        _trie = trie
+    return _trie
+
+# Number of trailing labels that form the public suffix of a list of labels.
+# A label can match both an explicit child and a wildcard, so every matching branch is followed; the longest rule wins
+# and an exception overrides them all.
+def _suffix_length(labels, trie):
+    nodes = [trie]
+    match = 1  # The implicit "*" rule: the last label is always a public suffix
+    for depth, label in enumerate(reversed(labels), start=1):
+        children = []
+        for node in nodes:
+            child = node.get(label)
+            if child is not None:
+                if EXCEPTION in child:
+                    return depth - 1
+                children.append(child)
+            wildcard = node.get(WILDCARD)
+            if wildcard is not None:
+                children.append(wildcard)
+        if not children:
+            break
+        if any(RULE in child for child in children):
+            match = depth
+        nodes = children
+    return match
+
+# Return the registrable domain (eTLD+1) of a hostname, or None for IPs and bare suffixes
+@lru_cache(maxsize=200000)
+def registrable_domain(host):
+    if not host:
+        return None
+    host = host.strip().rstrip('.').lower()
+    if not host or ':' in host or host.replace('.', '').isdigit():
+        return None  # IPv6, IPv4 or numeric junk
+    labels = host.split('.')
+    if '' in labels:
+        return None
+    suffix_length = _suffix_length(labels, load_trie())
+    if len(labels) <= suffix_length:
+        return None
+    return '.'.join(labels[-suffix_length - 1:])
+
+# Extract the hostname from a URL, dropping scheme, userinfo and port
+def host_from_url(url):
+    start = url.find('//')
+    start = 0 if start == -1 else start + 2
+    end = len(url)
+    for separator in '/?#':
+        index = url.find(separator, start)
+        if index != -1 and index < end:
+            end = index
+    netloc = url[start:end]
+    netloc = netloc[netloc.rfind('@') + 1:]
+    if netloc.startswith('['):
+        return None  # IPv6 literal
+    host = netloc.split(':', 1)[0]
+    return host.lower() or None
+
+# Registrable domain of a URL or bare hostname
+def domain_from_url(url):
+    return registrable_domain(host_from_url(url))
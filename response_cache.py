@@ -0,0 +1,258 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from metrics import metrics
+from write_behind import WriteBehindWriter
+
+# On-disk cache of fetched pages, so a changed analysis can be rerun without refetching the web.
+# Bodies are zlib-compressed and stored once per content digest under objects/; index.db maps each
+# (domain, stage) to its latest fetch and evicts the least recently used bodies past the size budget.
+
+# Response cache configuration
+RESPONSE_CACHE_DIR = 'response_cache'  # Default cache directory
+CACHE_MAX_BYTES = 20 * 1024 ** 3  # Compressed bytes kept on disk before eviction starts
+CACHE_EVICT_TARGET = 0.9  # Eviction stops below this share of CACHE_MAX_BYTES
+CACHE_EVICT_BATCH = 1000  # Bodies dropped per eviction transaction
+CACHE_COMPRESS_LEVEL = 6  # zlib level; the writer thread pays for it, not the event loop
+CACHE_BUSY_TIMEOUT = 30  # Seconds a writer waits for the index lock, e.g. with several shard processes
+
+# Cache modes for the crawl and probe stages
+RECORD = 'record'  # Fetch everything and store what was fetched
+REPLAY = 'replay'  # Serve domains found in the cache from disk; fetch and store the rest
+CACHE_MODES = [RECORD, REPLAY]
+
+CACHE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS responses (
+        domain TEXT NOT NULL,
+        stage TEXT NOT NULL,
+        fetched_at REAL NOT NULL,
+        url TEXT,
+        status INTEGER,
+        headers TEXT,
+        digest TEXT,
+        meta TEXT,
+        PRIMARY KEY (domain, stage)
+    );
+    CREATE INDEX IF NOT EXISTS idx_fetched_at ON responses (fetched_at);
+    CREATE INDEX IF NOT EXISTS idx_digest ON responses (digest);
+    CREATE TABLE IF NOT EXISTS objects (
+        digest TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        last_used REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_last_used ON objects (last_used);
+    CREATE TABLE IF NOT EXISTS usage (
+        id INTEGER PRIMARY KEY CHECK (id = 0),
+        bytes INTEGER NOT NULL
+    );
+    INSERT OR IGNORE INTO usage (id, bytes) VALUES (0, 0);
+"""
+
+class CachedResponse:
+    """ One cached fetch; body is None when nothing was stored, e.g. for an unreachable domain """
+
+    def __init__(self, domain, stage, fetched_at, url, status, headers, body, meta):
+        self.domain = domain
+        self.stage = stage
+        self.fetched_at = fetched_at
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.meta = meta
+
+    def text(self):
+        return self.body.decode(self.meta.get('charset') or 'utf-8', errors='replace')
+
+class ResponseCache:
+    """ Content-addressed store of response bodies with an SQLite index by domain and fetch time """
+
+    def __init__(self, directory=RESPONSE_CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.local = threading.local()
+        self.connections = []
+        self.connections_lock = threading.Lock()
+        self.touched = {}  # digest -> last read time, written with the next batch
+        self.touched_lock = threading.Lock()
+        os.makedirs(os.path.join(directory, 'objects'), exist_ok=True)
+        self.connection.executescript(CACHE_SCHEMA)
+        # Stores are compressed, written and indexed on a writer thread
+        self.writer = WriteBehindWriter(self._write_rows, name='response-cache').start()
+
+    # One connection per thread, as in storage.SQLiteStorage
+    @property
+    def connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(os.path.join(self.directory, 'index.db'), timeout=CACHE_BUSY_TIMEOUT,
+                                         isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = connection
+            with self.connections_lock:
+                self.connections.append(connection)
+        return connection
+
+    def _object_path(self, digest):
+        return os.path.join(self.directory, 'objects', digest[:2], digest)
+
+    # Whether a fetch of the domain is cached; an index lookup only, cheap enough for the event loop
+    def contains(self, domain, stage):
+        return self.connection.execute("SELECT 1 FROM responses WHERE domain = ? AND stage = ?", (domain, stage)).fetchone() is not None
+
+    # The latest cached fetch of a domain, or None; reads and decompresses the body, so run it off the event loop
+    def lookup(self, domain, stage):
+        row = self.connection.execute(
+            "SELECT fetched_at, url, status, headers, digest, meta FROM responses WHERE domain = ? AND stage = ?", (domain, stage)
+        ).fetchone()
+        if row is None:
+            metrics.inc('response_cache_total', result='miss')
+            return None
+        fetched_at, url, status, headers, digest, meta = row
+        body = None
+        if digest is not None:
+            try:
+                with open(self._object_path(digest), 'rb') as f:
+                    body = zlib.decompress(f.read())
+            except (OSError, zlib.error):
+                metrics.inc('response_cache_total', result='miss')  # Evicted since the index was read
+                return None
+            with self.touched_lock:
+                self.touched[digest] = time.time()
+        metrics.inc('response_cache_total', result='hit')
+        return CachedResponse(domain, stage, fetched_at, url, status, json.loads(headers or '{}'), body, json.loads(meta or '{}'))
+
+    # Queue a fetch for the writer thread; body may be None to remember an outcome without a page
+    async def store(self, domain, stage, url, status, headers, body, meta=None):
+        await self.writer.put((domain, stage, time.time(), url, status, dict(headers or {}), body, meta or {}))
+
+    def _write_rows(self, rows):
+        responses = []
+        objects = {}
+        for domain, stage, fetched_at, url, status, headers, body, meta in rows:
+            digest = None
+            if body is not None:
+                digest = hashlib.blake2b(body, digest_size=20).hexdigest()
+                if digest not in objects:
+                    objects[digest] = self._write_object(digest, body)
+            responses.append((domain, stage, fetched_at, url, status, json.dumps(headers), digest, json.dumps(meta)))
+
+        with self.touched_lock:
+            touched, self.touched = self.touched, {}
+        now = time.time()
+        connection = self.connection
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            added = 0
+            for digest, size in objects.items():
+                cursor = connection.execute("INSERT OR IGNORE INTO objects (digest, size, last_used) VALUES (?, ?, ?)", (digest, size, now))
+                if cursor.rowcount == 1:
+                    added += size
+                else:
+                    touched[digest] = now
+            connection.executemany("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)", responses)
+            connection.executemany("UPDATE objects SET last_used = ? WHERE digest = ?", [(used, digest) for digest, used in touched.items()])
+            connection.execute("UPDATE usage SET bytes = bytes + ? WHERE id = 0", (added,))
+            total = connection.execute("SELECT bytes FROM usage WHERE id = 0").fetchone()[0]
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        if total > self.max_bytes:
+            self.evict()
+
+    # Write a compressed body unless an identical one is already stored; returns its size on disk
+    def _write_object(self, digest, body):
+        path = self._object_path(digest)
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            pass
+        data = zlib.compress(body, CACHE_COMPRESS_LEVEL)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary, 'wb') as f:
+            f.write(data)
+        os.replace(temporary, path)
+        return len(data)
+
+    # Drop the least recently used bodies, and the index entries pointing at them, until under the target size
+    def evict(self, target=None):
+        target = int(self.max_bytes * CACHE_EVICT_TARGET) if target is None else target
+        connection = self.connection
+        evicted = 0
+        while True:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                total = connection.execute("SELECT bytes FROM usage WHERE id = 0").fetchone()[0]
+                victims = []
+                if total > target:
+                    # The oldest bodies, only as many as it takes to free total - target bytes
+                    excess = total - target
+                    for digest, size in connection.execute("SELECT digest, size FROM objects ORDER BY last_used LIMIT ?", (CACHE_EVICT_BATCH,)):
+                        victims.append((digest, size))
+                        excess -= size
+                        if excess <= 0:
+                            break
+                if victims:
+                    digests = [(digest,) for digest, _ in victims]
+                    connection.executemany("DELETE FROM objects WHERE digest = ?", digests)
+                    connection.executemany("DELETE FROM responses WHERE digest = ?", digests)
+                    connection.execute("UPDATE usage SET bytes = bytes - ? WHERE id = 0", (sum(size for _, size in victims),))
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+            if not victims:
+                break
+            for digest, _ in victims:
+                try:
+                    os.remove(self._object_path(digest))
+                except OSError:
+                    pass
+            evicted += len(victims)
+        if evicted:
+            logging.info(f"Response cache evicted {evicted:,} bodies")
+        return evicted
+
+    def stats(self):
+        connection = self.connection
+        return {
+            'responses': connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0],
+            'bodies': connection.execute("SELECT COUNT(*) FROM objects").fetchone()[0],
+            'bytes': connection.execute("SELECT bytes FROM usage WHERE id = 0").fetchone()[0],
+            'writer': self.writer.stats(),
+        }
+
+    # Write everything queued, then close the index
+    def close(self):
+        self.writer.close()
+        with self.touched_lock:
+            touched, self.touched = self.touched, {}
+        if touched:
+            self.connection.executemany("UPDATE objects SET last_used = ? WHERE digest = ?", [(used, digest) for digest, used in touched.items()])
+        with self.connections_lock:
+            for connection in self.connections:
+                connection.close()
+            self.connections = []
+        self.local = threading.local()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Show or shrink the response cache")
+    parser.add_argument('--dir', default=RESPONSE_CACHE_DIR)
+    parser.add_argument('--max-mb', type=int, help="Evict least recently used bodies down to this size")
+    args = parser.parse_args()
+    cache = ResponseCache(args.dir)
+    if args.max_mb is not None:
+        cache.evict(args.max_mb * 1024 * 1024)
+    stats = cache.stats()
+    print(f"{stats['responses']:,} responses, {stats['bodies']:,} distinct bodies, {stats['bytes'] / 1048576:,.1f} MB compressed")
+    cache.close()
@@ -1,5 +1,11 @@
+import argparse
+import json
+import os
+import time
 import mysql.connector
 import logging
+from domain_stats import StatsCounters, initialize_stats
+from probe_schema import checked_condition, has_legacy_columns, initialize_probe_schema
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
@@ -10,6 +16,12 @@ DB_USER = 'root'
 DB_PASSWORD = '1234'
 DB_NAME = 'domain_scraper'
 
+# Reset configuration
+RESET_CHUNK_SIZE = 5000  # Primary-key range reset per transaction
+RESET_MAX_ROWS_PER_SEC = 20000  # Id range scanned per second; 0 disables throttling
+RESET_STATE_FILE = 'reset_progress.json'  # Last completed id, for --resume
+PROGRESS_INTERVAL = 5  # Seconds between progress lines
+
 def connect_db():
     """Connect to the MySQL database."""
     return mysql.connector.connect(
@@ -19,20 +31,148 @@ def connect_db():
         database=DB_NAME
     )
 
-def reset_cms_and_domain_status():
-    """Reset all cms and domain_status columns to NULL in the domains table."""
+# Detected technologies as a per-row expression, for the filter and the cms_detected count
+HAS_TECHNOLOGY = "EXISTS (SELECT 1 FROM domain_technologies dt WHERE dt.domain_id = domains.id)"
+TECHNOLOGY_MATCH = """EXISTS (SELECT 1 FROM domain_technologies dt JOIN technologies t ON t.id = dt.tech_id
+                              WHERE dt.domain_id = domains.id AND t.name LIKE %s)"""
+
+def build_filter(older_than_days=None, unreachable=False, cms_match=None, legacy=False):
+    """Build the WHERE clause and parameters selecting which checked rows to reset.
+
+    With legacy set, rows that still only carry the old domain_status/cms text are matched as well.
+    """
+    conditions = [checked_condition(legacy)]
+    parameters = []
+    if older_than_days is not None:
+        conditions.append("(checked_at IS NULL OR checked_at < NOW() - INTERVAL %s DAY)")
+        parameters.append(older_than_days)
+    if unreachable:
+        conditions.append("(status_flags = 0 OR (status_flags IS NULL AND domain_status = ''))" if legacy else "status_flags = 0")
+    if cms_match:
+        if legacy:
+            conditions.append(f"({TECHNOLOGY_MATCH} OR (status_flags IS NULL AND cms LIKE %s))")
+            parameters += [f"%{cms_match}%", f"%{cms_match}%"]
+        else:
+            conditions.append(TECHNOLOGY_MATCH)
+            parameters.append(f"%{cms_match}%")
+    return ' AND '.join(conditions), parameters
+
+def load_state(signature):
+    """Return the last completed id of an interrupted run with the same filters, or None."""
+    try:
+        with open(RESET_STATE_FILE) as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return None
+    if state.get('filter') != signature:
+        logging.info("Saved progress was for different filters; starting from the beginning.")
+        return None
+    return state['last_id']
+
+def save_state(signature, last_id):
+    """Record the last completed id atomically."""
+    temporary = f"{RESET_STATE_FILE}.tmp"
+    with open(temporary, 'w') as f:
+        json.dump({'filter': signature, 'last_id': last_id}, f)
+    os.replace(temporary, RESET_STATE_FILE)
+
+def reset_chunk(db, where, parameters, start_id, end_id, legacy=False):
+    """Reset one id range in its own transaction, returning (rows reset, reachable among them, CMS among them)."""
+    cursor = db.cursor()
+    try:
+        if legacy:
+            reachable_column = "COALESCE(status_flags > 0, domain_status != '')"
+            technology_column = f"IF(status_flags IS NULL, cms IS NOT NULL AND cms != 'N/A', {HAS_TECHNOLOGY})"
+        else:
+            reachable_column, technology_column = "status_flags > 0", HAS_TECHNOLOGY
+        cursor.execute(f"""
+            SELECT id, {reachable_column}, {technology_column}
+            FROM domains WHERE id >= %s AND id < %s AND {where}
+            FOR UPDATE
+        """, [start_id, end_id] + parameters)
+        rows = cursor.fetchall()
+        if rows:
+            ids = [row[0] for row in rows]
+            placeholders = ', '.join(['%s'] * len(ids))
+            legacy_columns = ", cms = NULL, domain_status = NULL" if legacy else ""
+            cursor.execute(f"DELETE FROM domain_technologies WHERE domain_id IN ({placeholders})", ids)
+            cursor.execute(f"UPDATE domains SET status_flags = NULL, checked_at = NULL{legacy_columns} WHERE id IN ({placeholders})", ids)
+        db.commit()
+        return len(rows), sum(1 for row in rows if row[1]), sum(1 for row in rows if row[2])
+    except mysql.connector.Error:
+        db.rollback()
+        raise
+    finally:
+        cursor.close()
+
+def reset_cms_and_domain_status(older_than_days=None, unreachable=False, cms_match=None, resume=False,
+                                chunk_size=RESET_CHUNK_SIZE, max_rows_per_sec=RESET_MAX_ROWS_PER_SEC):
+    """Clear status_flags and detected technologies in primary-key chunks, throttled and resumable."""
+    signature = json.dumps([older_than_days, unreachable, cms_match])
     db = connect_db()
+    initialize_probe_schema(db)
+    initialize_stats(db)
+    legacy = has_legacy_columns(db)
+    where, parameters = build_filter(older_than_days, unreachable, cms_match, legacy)
+    counters = StatsCounters(connect_db)
+
     cursor = db.cursor()
+    cursor.execute("SELECT COALESCE(MIN(id), 0), COALESCE(MAX(id), 0) FROM domains")
+    min_id, max_id = cursor.fetchone()
+    cursor.close()
 
-    logging.info("Setting all cms and domain_status columns to NULL.")
+    resumed_from = load_state(signature) if resume else None
+    start_id = resumed_from + 1 if resumed_from is not None else min_id
+    first_id = start_id
+    logging.info(f"Resetting ids {start_id:,}..{max_id:,} where {where} "
+                 f"({'resumed' if resumed_from is not None else 'fresh run'})")
 
-    # Reset cms and domain_status to NULL
-    cursor.execute("UPDATE domains SET cms = NULL, domain_status = NULL")
-    db.commit()
+    started = time.monotonic()
+    last_report = started
+    total_reset = 0
+    while start_id <= max_id:
+        chunk_started = time.monotonic()
+        end_id = start_id + chunk_size
+        count, reachable, cms_detected = reset_chunk(db, where, parameters, start_id, end_id, legacy)
+        counters.add('processed', -count)
+        counters.add('reachable', -reachable)
+        counters.add('cms_detected', -cms_detected)
+        counters.flush()
+        total_reset += count
+        save_state(signature, end_id - 1)
+        start_id = end_id
+
+        now = time.monotonic()
+        if now - last_report >= PROGRESS_INTERVAL or start_id > max_id:
+            done = min(start_id, max_id + 1) - first_id
+            remaining = max(0, max_id + 1 - start_id)
+            rate = done / (now - started) if now > started else 0.0
+            eta = remaining / rate if rate else 0.0
+            percent = done / (max_id + 1 - first_id) * 100 if max_id >= first_id else 100.0
+            logging.info(f"{percent:.1f}% (id {start_id - 1:,} of {max_id:,}), {total_reset:,} rows reset, "
+                         f"{rate:,.0f} ids/sec, ETA {eta / 60:.1f} min")
+            last_report = now
+
+        # Throttle so running crawlers keep getting lock time and I/O
+        if max_rows_per_sec:
+            minimum = chunk_size / max_rows_per_sec
+            elapsed = time.monotonic() - chunk_started
+            if elapsed < minimum:
+                time.sleep(minimum - elapsed)
 
-    cursor.close()
     db.close()
-    logging.info("All cms and domain_status columns have been reset to NULL.")
+    if os.path.exists(RESET_STATE_FILE):
+        os.remove(RESET_STATE_FILE)
+    logging.info(f"Reset {total_reset:,} rows.")
 
 if __name__ == "__main__":
-    reset_cms_and_domain_status()
+    parser = argparse.ArgumentParser(description="Reset probe results so the checker runs again")
+    parser.add_argument('--older-than', type=int, metavar='DAYS', help="Only rows last checked more than DAYS ago")
+    parser.add_argument('--unreachable', action='store_true', help="Only rows where no URL variant was reachable")
+    parser.add_argument('--cms', metavar='TEXT', help="Only rows whose detected technologies contain TEXT")
+    parser.add_argument('--chunk-size', type=int, default=RESET_CHUNK_SIZE, help="Ids per transaction")
+    parser.add_argument('--max-rows-per-sec', type=int, default=RESET_MAX_ROWS_PER_SEC, help="Throttle; 0 disables it")
+    parser.add_argument('--resume', action='store_true', help=f"Continue from the last completed id in {RESET_STATE_FILE}")
+    args = parser.parse_args()
+    reset_cms_and_domain_status(args.older_than, args.unreachable, args.cms, args.resume,
+                                args.chunk_size, args.max_rows_per_sec)
@@ -0,0 +1,155 @@
+import hashlib
+import logging
+import math
+import os
+import struct
+import threading
+import time
+
+# Seen-set configuration
+SEEN_FILTER_CAPACITY = 20_000_000  # Expected number of distinct domains
+SEEN_FILTER_FP_RATE = 0.001  # Target false-positive rate at full capacity
+SEEN_FILTER_MAX_BYTES = 256 * 1024 * 1024  # Memory budget for the bit array
+SEEN_FILTER_SNAPSHOT = 'seen_filter.bin'  # Snapshot file, reloaded at startup
+SNAPSHOT_INTERVAL = 300  # Seconds between periodic snapshots
+WARM_LOAD_BATCH_SIZE = 50000  # Rows fetched per keyset page during warm-up
+
+SNAPSHOT_MAGIC = b'RBLOOM1\0'
+SNAPSHOT_HEADER = struct.Struct('<8sQIQQd')  # magic, bits, hashes, items, last_id, fp_rate
+
+class BloomFilter:
+    """ Thread-safe Bloom filter of domains that are already in the domains table """
+
+    def __init__(self, capacity=SEEN_FILTER_CAPACITY, fp_rate=SEEN_FILTER_FP_RATE, max_bytes=SEEN_FILTER_MAX_BYTES,
+                 num_bits=None, num_hashes=None):
+        if num_bits is None:
+            num_bits = math.ceil(-capacity * math.log(fp_rate) / (math.log(2) ** 2))
+            if max_bytes and num_bits > max_bytes * 8:
+                logging.warning(f"Seen filter capped at {max_bytes:,} bytes; false-positive rate will exceed {fp_rate}")
+                num_bits = max_bytes * 8
+        if num_hashes is None:
+            num_hashes = max(1, min(16, round(num_bits / capacity * math.log(2))))
+
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.fp_rate = fp_rate
+        self.bits = bytearray((num_bits + 7) // 8)
+        self.items = 0
+        self.last_id = 0  # Highest domains.id known to be loaded
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1, h2 = struct.unpack('<QQ', digest)
+        h2 |= 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def __contains__(self, key):
+        bits = self.bits
+        return all(bits[p >> 3] & (1 << (p & 7)) for p in self._positions(key))
+
+    # Add a key, returning True if it was not already present
+    def add(self, key):
+        positions = self._positions(key)
+        with self.lock:
+            added = False
+            for p in positions:
+                mask = 1 << (p & 7)
+                if not self.bits[p >> 3] & mask:
+                    self.bits[p >> 3] |= mask
+                    added = True
+            if added:
+                self.items += 1
+            return added
+
+    def add_all(self, keys):
+        for key in keys:
+            self.add(key)
+
+    # Return the keys that are definitely not in the filter, counting hits and misses
+    def filter_unseen(self, keys):
+        unseen = [key for key in keys if key not in self]
+        with self.lock:
+            self.misses += len(unseen)
+            self.hits += len(keys) - len(unseen)
+        return unseen
+
+    # Estimated false-positive rate at the current fill
+    def current_fp_rate(self):
+        return (1 - math.exp(-self.num_hashes * self.items / self.num_bits)) ** self.num_hashes
+
+    def stats(self):
+        with self.lock:
+            checked = self.hits + self.misses
+            return {
+                'items': self.items,
+                'bytes': len(self.bits),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / checked if checked else 0.0,
+                'fp_rate': self.current_fp_rate(),
+            }
+
+    # Write the filter to disk atomically
+    def save(self, path):
+        tmp_path = f"{path}.tmp"
+        with self.lock:
+            header = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, self.num_bits, self.num_hashes, self.items, self.last_id, self.fp_rate)
+            with open(tmp_path, 'wb') as f:
+                f.write(header)
+                f.write(self.bits)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            magic, num_bits, num_hashes, items, last_id, fp_rate = SNAPSHOT_HEADER.unpack(f.read(SNAPSHOT_HEADER.size))
+            if magic != SNAPSHOT_MAGIC:
+                raise ValueError(f"{path} is not a seen filter snapshot")
+            bloom = cls(fp_rate=fp_rate, num_bits=num_bits, num_hashes=num_hashes)
+            f.readinto(bloom.bits)
+        bloom.items = items
+        bloom.last_id = last_id
+        return bloom
+
+# Stream domains with id > last_id into the filter using keyset pagination
+def warm_load(bloom, storage, batch_size=WARM_LOAD_BATCH_SIZE, key_range=None):
+    start = time.time()
+    loaded = 0
+    while True:
+        rows = storage.domain_page(bloom.last_id, batch_size, key_range)
+        if not rows:
+            break
+        for _, domain in rows:
+            if domain:
+                bloom.add(domain)
+        bloom.last_id = rows[-1][0]
+        loaded += len(rows)
+    logging.info(f"Seen filter warm-loaded {loaded:,} domains in {time.time() - start:.1f}s")
+    return loaded
+
+# Load the snapshot if there is one, then catch up on rows added since it was written.
+# A sharded process passes its key_range and a share of the capacity, and keeps a snapshot of its own.
+def load_seen_filter(storage, path=SEEN_FILTER_SNAPSHOT, capacity=SEEN_FILTER_CAPACITY, key_range=None):
+    bloom = None
+    if path and os.path.exists(path):
+        try:
+            bloom = BloomFilter.load(path)
+            logging.info(f"Loaded seen filter snapshot {path} ({bloom.items:,} domains, last id {bloom.last_id:,})")
+        except (OSError, ValueError, struct.error) as e:
+            logging.error(f"Ignoring unreadable seen filter snapshot {path}: {e}")
+    if bloom is None:
+        bloom = BloomFilter(capacity)
+    warm_load(bloom, storage, key_range=key_range)
+    return bloom
+
+# Periodically snapshot the filter to disk; run in a daemon thread
+def snapshot_periodically(bloom, path=SEEN_FILTER_SNAPSHOT, interval=SNAPSHOT_INTERVAL):
+    while True:
+        time.sleep(interval)
+        try:
+            bloom.save(path)
+        except OSError as e:
+            logging.error(f"Failed to write seen filter snapshot {path}: {e}")
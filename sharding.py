@@ -0,0 +1,48 @@
+from normalization import domain_key, normalize_domain
+
+# The domain space is cut into fixed hash buckets, the first two bytes of domain_key. A shard owns a contiguous
+# bucket range, which is also a contiguous domain_key range, so claims are index range scans on the existing
+# key and the shard count can change between runs.
+BUCKETS = 65536
+
+# Bucket of a 16-byte domain_key
+def domain_bucket(key):
+    return int.from_bytes(key[:2], 'big')
+
+# Half-open bucket range [low, high) owned by shard `index` of `count`
+def shard_buckets(index, count):
+    return index * BUCKETS // count, (index + 1) * BUCKETS // count
+
+# The same range as domain_key bounds; high is None for the last shard
+def shard_key_range(index, count):
+    low, high = shard_buckets(index, count)
+    return low.to_bytes(2, 'big'), high.to_bytes(2, 'big') if high < BUCKETS else None
+
+# Shard whose shard_buckets() range holds the bucket
+def shard_of_bucket(bucket, count):
+    return ((bucket + 1) * count - 1) // BUCKETS
+
+# Shard that owns a domain, normalizing it first so every ingest path agrees
+def shard_of(domain, count):
+    return shard_of_bucket(domain_bucket(domain_key(normalize_domain(domain))), count)
+
+# SQL condition and parameters restricting domain_key to a shard's range
+def key_range_condition(key_range, placeholder='%s'):
+    if key_range is None:
+        return '', []
+    low, high = key_range
+    if high is None:
+        return f" AND domain_key >= {placeholder}", [low]
+    return f" AND domain_key >= {placeholder} AND domain_key < {placeholder}", [low, high]
+
+# Index for sharded frontier claims. Rows without a domain_key yet (see clean_urls.py) are only claimed by unsharded runs.
+def initialize_shard_index(db):
+    cursor = db.cursor()
+    cursor.execute("""
+        SELECT INDEX_NAME FROM INFORMATION_SCHEMA.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'domains' AND INDEX_NAME = 'idx_shard_frontier'
+    """)
+    if cursor.fetchone() is None:
+        cursor.execute("ALTER TABLE domains ADD INDEX idx_shard_frontier (crawled, domain_key)")
+    db.commit()
+    cursor.close()
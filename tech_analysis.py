@@ -0,0 +1,47 @@
+import asyncio
+import logging
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+# Technology analysis configuration
+TECH_WORKERS = os.cpu_count() or 4  # Processes running Wappalyzer regex matching
+
+# Per-process Wappalyzer instance, compiled once by the pool initializer
+_wappalyzer = None
+
+# Load and compile the fingerprint database once in this process
+def load_wappalyzer():
+    global _wappalyzer
+    if _wappalyzer is None:
+        from Wappalyzer import Wappalyzer
+        # A few upstream fingerprints fail to compile; keep those warnings off the curses screen
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            _wappalyzer = Wappalyzer.latest()
+    return _wappalyzer
+
+# Analyze an already-fetched page; runs inside a pool process
+def analyze_page(url, html, headers):
+    try:
+        from requests.structures import CaseInsensitiveDict
+        from Wappalyzer import WebPage
+        webpage = WebPage(url, html, CaseInsensitiveDict(headers))
+        return load_wappalyzer().analyze_with_versions_and_categories(webpage)
+    except Exception as e:
+        logging.debug(f"Technology analysis failed for {url}: {e}")
+        return None
+
+class TechAnalyzer:
+    """ Runs Wappalyzer over fetched pages in a process pool without blocking the event loop """
+
+    def __init__(self, workers=None):
+        # TECH_WORKERS is read here so sharded runs can split the cores between processes
+        self.executor = ProcessPoolExecutor(max_workers=workers or TECH_WORKERS, initializer=load_wappalyzer)
+
+    async def analyze(self, url, html, headers):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, analyze_page, url, html, dict(headers))
+
+    def close(self):
+        self.executor.shutdown()
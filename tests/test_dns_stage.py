@@ -0,0 +1,82 @@
+import asyncio
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from dns_stage import ERROR, NXDOMAIN, RESOLVED, DnsResolver
+from dns_stub import start_stub
+
+ZONE = {'live.test': ['127.0.0.1'], 'www.apex-only.test': ['127.0.0.2']}
+TTL = 120
+
+# Run fn(resolver, stub) against a stub server on the loopback interface
+def with_stub(fn, **stub_options):
+    async def run():
+        transport, stub = await start_stub(ZONE, ttl=TTL, **stub_options)
+        resolver = DnsResolver(transport.get_extra_info('sockname'), timeout=0.2, retries=1)
+        try:
+            return await fn(resolver, stub)
+        finally:
+            resolver.close()
+            transport.close()
+    return asyncio.run(run())
+
+def test_nxdomain_marks_domain_dead():
+    async def check(resolver, stub):
+        assert await resolver.domain_is_dead('missing.test')
+        assert not await resolver.domain_is_dead('live.test')
+        assert not await resolver.domain_is_dead('apex-only.test')  # Only www has an address
+        live, dead = await resolver.partition(['live.test', 'missing.test'])
+        assert (live, dead) == (['live.test'], ['missing.test'])
+    with_stub(check)
+
+def test_positive_answer_cached_for_ttl():
+    async def check(resolver, stub):
+        result = await resolver.resolve('live.test')
+        assert result.status == RESOLVED and result.addresses == ['127.0.0.1']
+        assert abs(result.expires - (time.monotonic() + TTL)) < 5
+        queries = stub.queries
+        assert await resolver.resolve('LIVE.test.') is result
+        assert stub.queries == queries
+        result.expires = time.monotonic() - 1  # Past its TTL
+        assert (await resolver.resolve('live.test')).status == RESOLVED
+        assert stub.queries == queries + 1
+    with_stub(check)
+
+def test_nxdomain_negatively_cached():
+    async def check(resolver, stub):
+        result = await resolver.resolve('missing.test')
+        assert result.status == NXDOMAIN and result.is_dead()
+        queries = stub.queries
+        assert await resolver.resolve('missing.test') is result
+        assert stub.queries == queries
+        assert resolver.stats['dead'] == 1
+    with_stub(check)
+
+def test_timeout_is_error_not_dead():
+    async def check(resolver, stub):
+        result = await resolver.resolve('slow.test')
+        assert result.status == ERROR and not result.is_dead()
+        assert 'slow.test' not in resolver.cache
+        assert not await resolver.domain_is_dead('slow.test')
+        assert stub.queries >= 2  # Retried before giving up
+    with_stub(check, drop=['slow.test', 'www.slow.test'])
+
+def test_truncated_answer_is_error():
+    async def check(resolver, stub):
+        result = await resolver.resolve('big.test')
+        assert result.status == ERROR
+        assert 'big.test' not in resolver.cache
+    with_stub(check, truncate=['big.test'])
+
+def test_concurrent_lookups_share_one_query():
+    async def check(resolver, stub):
+        results = await asyncio.gather(*(resolver.resolve('live.test') for _ in range(10)))
+        assert all(result is results[0] for result in results)
+        assert stub.queries == 1
+        assert not resolver.in_flight
+    with_stub(check)
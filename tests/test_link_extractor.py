@@ -0,0 +1,45 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from link_extractor import ENGINES, extract_links, iter_links
+
+BASE_URL = 'http://example.com/'
+
+PAGE = """<html><head>
+<style>a[href="http://style.example/"] { color: red }</style>
+<script>document.write('<a href="http://script.example/">x</a>');</script>
+<SCRIPT type="text/javascript">var s = "<a href='http://upper-script.example/'>";</SCRIPT>
+</head><body>
+<a href="http://one.example/">one</a>
+<a data-href="http://data-href.example/">data</a>
+<a data-href="http://data-href-two.example/" href="http://two.example/">two</a>
+<!-- <a href="http://comment.example/">commented out</a> -->
+<!--
+  <a href='http://multiline-comment.example/'>
+-->
+<a class="x"
+   HREF='/relative/three'>three</a>
+<a href=http://four.example/path?q=1>four</a>
+<abbr href="http://abbr.example/">not a link</abbr>
+</body></html>
+"""
+
+EXPECTED = [
+    'http://one.example/',
+    'http://two.example/',
+    'http://example.com/relative/three',
+    'http://four.example/path?q=1',
+]
+
+def test_engines_agree():
+    for engine in ENGINES:
+        assert extract_links(PAGE, BASE_URL, engine) == EXPECTED, engine
+
+# Comments, script bodies and tags split at every possible chunk boundary
+def test_regex_engine_across_chunks():
+    data = PAGE.encode()
+    for size in (1, 2, 3, 7, 16, 64):
+        chunks = [data[i:i + size] for i in range(0, len(data), size)]
+        assert list(iter_links(chunks, BASE_URL, 'regex')) == EXPECTED, size
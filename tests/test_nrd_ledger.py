@@ -0,0 +1,136 @@
+import hashlib
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import nrd_roomba
+from normalization import domain_key
+from nrd_stub import make_fixture_zip, start_stub
+
+KNOWN = ['known.com']
+ARCHIVE_LINES = ['fresh-one.com', 'FRESH-ONE.com', 'www.fresh-two.net', 'known.com', 'not a domain']
+ARCHIVE = make_fixture_zip(ARCHIVE_LINES)
+ARCHIVE_NAME = '2024-01-01.zip'
+
+class DomainsTable:
+    """ The domains table as far as INSERT IGNORE sees it: unique domain and domain_key """
+
+    def __init__(self, domains=()):
+        self.domains = set()
+        self.keys = set()
+        for domain in domains:
+            self.insert(domain, domain_key(domain))
+
+    def insert(self, domain, key):
+        if domain in self.domains or key in self.keys:
+            return 0
+        self.domains.add(domain)
+        self.keys.add(key)
+        return 1
+
+    def connect(self, **options):
+        return _Connection(self)
+
+class _Connection:
+    def __init__(self, table):
+        self.table = table
+
+    def cursor(self):
+        return _Cursor(self.table)
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+class _Cursor:
+    def __init__(self, table):
+        self.table = table
+        self.rowcount = 0
+
+    def execute(self, query, parameters):
+        assert query.startswith('INSERT IGNORE INTO domains'), query
+        pairs = zip(parameters[0::2], parameters[1::2])
+        self.rowcount = sum(self.table.insert(domain, key) for domain, key in pairs)
+
+    def close(self):
+        pass
+
+@pytest.fixture
+def stub():
+    server, index_url, stats = start_stub({ARCHIVE_NAME: ARCHIVE})
+    yield index_url, stats
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def ledger(monkeypatch):
+    """ The domains table and every record_archive() call, standing in for MySQL """
+    table = DomainsTable(KNOWN)
+    records = []
+    monkeypatch.setattr(nrd_roomba, 'connect_db', table.connect)
+    monkeypatch.setattr(nrd_roomba, 'record_archive', lambda url, download, result=None: records.append((url, download, result)))
+    monkeypatch.setattr(nrd_roomba.stats_counters, 'apply', lambda deltas: None)
+    monkeypatch.setattr(nrd_roomba, 'LEDGER_MODE', 'skip')
+    return table, records
+
+def archive_url(index_url):
+    urls = nrd_roomba.find_archive_urls(index_url)
+    assert len(urls) == 1
+    return urls[0]
+
+def test_new_archive_is_ingested_with_counts(stub, ledger):
+    index_url, stats = stub
+    table, records = ledger
+    outcome, result = nrd_roomba.process_archive(archive_url(index_url))
+    assert outcome == 'ingested'
+    assert (result.ingested, result.new, result.duplicates, result.skipped) == (5, 2, 2, 1)
+    assert result.ingested == result.new + result.duplicates + result.skipped
+    assert {'fresh-one.com', 'fresh-two.net'} <= table.domains
+    (url, download, recorded), = records
+    assert recorded is result
+    assert download.sha256 == hashlib.sha256(ARCHIVE).hexdigest() and download.etag
+    assert stats['downloads'] == 1
+
+def test_ledgered_archive_is_skipped(stub, ledger):
+    index_url, stats = stub
+    _, records = ledger
+    entry = {'url': archive_url(index_url), 'etag': '"x"', 'content_sha256': 'x', 'ingested_at': '2024-01-02 00:00:00'}
+    assert nrd_roomba.process_archive(entry['url'], entry) == ('skipped', None)
+    assert stats['downloads'] == stats['not_modified'] == 0
+    assert records == []
+
+def test_not_modified_is_recorded_without_ingest(stub, ledger, monkeypatch):
+    index_url, stats = stub
+    table, records = ledger
+    url = archive_url(index_url)
+    nrd_roomba.process_archive(url)
+    etag = records[0][1].etag
+    domains = set(table.domains)
+
+    monkeypatch.setattr(nrd_roomba, 'LEDGER_MODE', 'revalidate')
+    entry = {'url': url, 'etag': etag, 'content_sha256': records[0][1].sha256, 'ingested_at': '2024-01-02 00:00:00'}
+    assert nrd_roomba.process_archive(url, entry) == ('not_modified', None)
+    assert stats['not_modified'] == 1 and stats['downloads'] == 1
+    _, download, result = records[-1]
+    assert download.archive is None and download.etag == etag and result is None
+    assert table.domains == domains
+
+def test_unchanged_content_is_not_reingested(stub, ledger, monkeypatch):
+    index_url, stats = stub
+    table, records = ledger
+    url = archive_url(index_url)
+    monkeypatch.setattr(nrd_roomba, 'LEDGER_MODE', 'revalidate')
+    # A stale ETag makes the server send the archive again, but its content hash is the one already ingested
+    entry = {'url': url, 'etag': '"stale"', 'content_sha256': hashlib.sha256(ARCHIVE).hexdigest(), 'ingested_at': '2024-01-02 00:00:00'}
+    assert nrd_roomba.process_archive(url, entry) == ('unchanged', None)
+    assert stats['downloads'] == 1
+    assert table.domains == set(KNOWN)
+    _, download, result = records[-1]
+    assert result is None and download.sha256 == entry['content_sha256']
@@ -0,0 +1,40 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from public_suffix import _suffix_length, compile_trie, registrable_domain
+
+RULES = """
+// ===BEGIN ICANN DOMAINS===
+ck
+*.ck
+!www.ck
+bar.foo.ck
+com
+"""
+
+def suffix(host, trie):
+    labels = host.split('.')
+    return '.'.join(labels[-_suffix_length(labels, trie):])
+
+def test_wildcard_survives_a_deeper_explicit_rule(tmp_path):
+    path = tmp_path / 'psl.dat'
+    path.write_text(RULES)
+    trie = compile_trie(str(path))
+    # foo.ck only exists in the trie as the parent of bar.foo.ck; *.ck still makes it a suffix
+    assert suffix('x.foo.ck', trie) == 'foo.ck'
+    assert suffix('x.bar.foo.ck', trie) == 'bar.foo.ck'
+    assert suffix('x.other.ck', trie) == 'other.ck'
+    assert suffix('www.ck', trie) == 'ck'  # Exception to *.ck
+    assert suffix('a.www.ck', trie) == 'ck'
+    assert suffix('x.example.com', trie) == 'com'
+    assert suffix('x.example.zz', trie) == 'zz'  # Implicit * rule
+
+def test_bundled_list():
+    assert registrable_domain('a.b.example.ck') == 'b.example.ck'
+    assert registrable_domain('www.ck') == 'www.ck'
+    assert registrable_domain('foo.www.ck') == 'www.ck'
+    assert registrable_domain('shop.example.co.uk') == 'example.co.uk'
+    assert registrable_domain('co.uk') is None
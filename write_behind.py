@@ -0,0 +1,122 @@
+import asyncio
+import logging
+import queue
+import threading
+import time
+
+# Write-behind configuration
+WRITE_BATCH_SIZE = 500  # Rows per flush
+WRITE_FLUSH_INTERVAL = 1.0  # Seconds a partial batch may wait before it is flushed
+WRITE_QUEUE_SIZE = 5000  # Pending rows before producers are made to wait
+WRITE_RETRIES = 3  # Attempts per batch before it is dropped
+
+_STOP = object()
+
+class _FlushRequest:
+    def __init__(self):
+        self.done = threading.Event()
+
+class WriteBehindWriter:
+    """ Collects rows and writes them in batches from a dedicated writer thread """
+
+    def __init__(self, flush_rows, batch_size=WRITE_BATCH_SIZE, flush_interval=WRITE_FLUSH_INTERVAL,
+                 max_pending=WRITE_QUEUE_SIZE, name='write-behind'):
+        self.flush_rows = flush_rows  # Called on the writer thread with a list of rows
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self.lock = threading.Lock()
+        self.written = 0
+        self.flushes = 0
+        self.dropped = 0
+        self.stalls = 0  # Times a producer had to wait for the writer
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    # Queue a row from the event loop, waiting without blocking the loop when the queue is full
+    async def put(self, row):
+        try:
+            self.queue.put_nowait(row)
+        except queue.Full:
+            with self.lock:
+                self.stalls += 1
+            await asyncio.get_running_loop().run_in_executor(None, self.queue.put, row)
+
+    # Queue a row from a regular thread, blocking when the queue is full
+    def put_blocking(self, row):
+        try:
+            self.queue.put_nowait(row)
+        except queue.Full:
+            with self.lock:
+                self.stalls += 1
+            self.queue.put(row)
+
+    # Wait until every row queued so far has been written
+    async def drain(self):
+        request = _FlushRequest()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.queue.put, request)
+        await loop.run_in_executor(None, request.done.wait)
+
+    # Flush everything and stop the writer thread
+    def close(self):
+        self.queue.put(_STOP)
+        self.thread.join()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'written': self.written,
+                'flushes': self.flushes,
+                'dropped': self.dropped,
+                'stalls': self.stalls,
+                'pending': self.queue.qsize(),
+            }
+
+    def _flush(self, batch):
+        if not batch:
+            return
+        for attempt in range(1, WRITE_RETRIES + 1):
+            try:
+                self.flush_rows(batch)
+                with self.lock:
+                    self.written += len(batch)
+                    self.flushes += 1
+                return
+            except Exception as e:
+                logging.error(f"Write-behind flush of {len(batch)} rows failed (attempt {attempt}): {e}")
+                time.sleep(attempt)
+        with self.lock:
+            self.dropped += len(batch)
+
+    def _run(self):
+        batch = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                self._flush(batch)
+                return
+            if isinstance(item, _FlushRequest):
+                self._flush(batch)
+                batch = []
+                deadline = None
+                item.done.set()
+                continue
+            if item is not None:
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+
+            if len(batch) >= self.batch_size or (batch and time.monotonic() >= deadline):
+                self._flush(batch)
+                batch = []
+                deadline = None